@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_WORKERS = int(os.getenv("MICAEXP_MAX_WORKERS", 8))
+
+
+def fetch_all(
+    tasks: dict[str, Callable],
+    max_workers: int = None,
+    on_done: Callable[[str, int, int], None] = None,
+) -> dict:
+    """
+    Run independent upstream requests concurrently
+
+    input :
+    -------
+        tasks : dict
+            Task name -> zero argument callable (e.g. functools.partial)
+        max_workers : int
+            Concurrency cap
+            Default = MICAEXP_MAX_WORKERS env variable, or 8
+        on_done : callable
+            Called with (task name, tasks done, tasks total) as each task
+            completes, e.g. to report progress
+    return :
+    --------
+        results : dict
+            Task name -> callable return value. The first exception raised by
+            a task is re-raised once the pending tasks are cancelled.
+    """
+    if not tasks:
+        return {}
+    max_workers = min(max_workers or MAX_WORKERS, len(tasks))
+    results = {}
+
+    def done(name, result):
+        results[name] = result
+        if on_done is not None:
+            on_done(name, len(results), len(tasks))
+
+    if max_workers <= 1:
+        for name, task in tasks.items():
+            done(name, task())
+        return results
+
+    # A pool per call: tasks can fan out themselves without starving a shared pool
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(task): name for name, task in tasks.items()}
+        try:
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return results
@@ -0,0 +1,183 @@
+import os
+import re
+import threading
+import time
+import warnings
+from urllib.parse import urlsplit
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InsecureRequestWarning
+from urllib3.util.retry import Retry
+
+from api_calls.fan_out import MAX_WORKERS
+
+load_dotenv()
+
+CONNECT_TIMEOUT = float(os.getenv("MICAEXP_HTTP_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT = float(os.getenv("MICAEXP_HTTP_READ_TIMEOUT", 120))
+RETRIES = int(os.getenv("MICAEXP_HTTP_RETRIES", 3))
+BACKOFF = float(os.getenv("MICAEXP_HTTP_BACKOFF", 0.5))
+
+# Extra hosts queried with verify=False, comma separated. The XR dms-api
+# host is registered from its URLs by api_calls.xair.
+UNVERIFIED_HOSTS = [
+    host.strip()
+    for host in os.getenv("MICAEXP_HTTP_UNVERIFIED_HOSTS", "").split(",")
+    if host.strip()
+]
+
+# Minutes between two prints of the per-host stats, 0 disables them
+STATS_LOG_INTERVAL = float(os.getenv("MICAEXP_HTTP_STATS_LOG_MIN", 60)) * 60
+
+
+class HttpClient:
+    """
+    Thread-safe HTTP client keeping one pooled keep-alive session per host,
+    with at most pool_size requests in flight per host
+
+    Requests get a (connect, read) timeout and are retried with exponential
+    backoff on connection errors, 429 and 5xx responses (GET and POST: both
+    APIs only read data). Per-host latency stats are available via stats()
+    and printed every stats_log_interval seconds.
+    """
+
+    def __init__(
+        self,
+        timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT),
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+        pool_size: int = MAX_WORKERS,
+        unverified_hosts: list = UNVERIFIED_HOSTS,
+        stats_log_interval: float = STATS_LOG_INTERVAL,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._sessions = {}
+        # Per host, at most pool_size requests at a time (see request)
+        self._slots = {}
+        self._stats = {}
+        self.stats_log_interval = stats_log_interval
+        self._stats_logged_at = time.monotonic()
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        self.unverified_hosts = set()
+        for host in unverified_hosts:
+            self.skip_verify(host)
+
+    def skip_verify(self, url: str):
+        """
+        Query the host of url (or url itself if it is a bare host) with
+        verify=False, without the InsecureRequestWarning of each request
+        """
+        host = urlsplit(url).hostname or url
+        if host not in self.unverified_hosts:
+            self.unverified_hosts.add(host)
+            warnings.filterwarnings(
+                "ignore",
+                message=f".*host '{re.escape(host)}'",
+                category=InsecureRequestWarning,
+            )
+
+    def _reset_after_fork(self):
+        # The pooled connections belong to the parent process
+        self._sessions = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def session(self, host: str) -> requests.Session:
+        with self._lock:
+            if host not in self._sessions:
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=self.backoff,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET", "POST"],
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+                self._slots[host] = threading.BoundedSemaphore(self.pool_size)
+            return self._sessions[host]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        host = urlsplit(url).hostname
+        kwargs.setdefault("timeout", self.timeout)
+        if host in self.unverified_hosts:
+            kwargs.setdefault("verify", False)
+
+        session = self.session(host)
+        # Nested fan-outs (fetch_all tasks fetching chunks) may run more
+        # threads than pooled connections: the extra ones wait here rather
+        # than open connections the pool would discard
+        with self._slots[host]:
+            start = time.perf_counter()
+            failed = True
+            try:
+                response = session.request(method, url, **kwargs)
+                response.raise_for_status()
+                failed = False
+                return response
+            finally:
+                self.record(host, time.perf_counter() - start, failed)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def record(self, host: str, latency: float, failed: bool):
+        with self._lock:
+            host_stats = self._stats.setdefault(
+                host,
+                {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0, "last_s": 0.0},
+            )
+            host_stats["calls"] += 1
+            host_stats["errors"] += int(failed)
+            host_stats["total_s"] += latency
+            host_stats["max_s"] = max(host_stats["max_s"], latency)
+            host_stats["last_s"] = latency
+            log_stats = (
+                self.stats_log_interval
+                and time.monotonic() - self._stats_logged_at >= self.stats_log_interval
+            )
+            if log_stats:
+                self._stats_logged_at = time.monotonic()
+        if log_stats:
+            self.log_stats()
+
+    def stats(self) -> dict:
+        """
+        Per-host call count, error count and latencies (seconds)
+        """
+        with self._lock:
+            return {
+                host: {
+                    **host_stats,
+                    "mean_s": host_stats["total_s"] / host_stats["calls"],
+                }
+                for host, host_stats in self._stats.items()
+            }
+
+    def log_stats(self):
+        for host, host_stats in self.stats().items():
+            print(
+                f"HTTP {host} (pid {os.getpid()}): {host_stats['calls']} calls, "
+                f"{host_stats['errors']} errors, mean {host_stats['mean_s']:.2f} s, "
+                f"max {host_stats['max_s']:.2f} s"
+            )
+
+
+http_client = HttpClient()
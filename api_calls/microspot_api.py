@@ -1,83 +1,277 @@
-import requests
 import json
+from functools import partial
+from itertools import chain
+from typing import NamedTuple
+import numpy as np
 import pandas as pd
 import os
 from dotenv import load_dotenv
 
+from api_calls.http_client import http_client
+from api_calls.fan_out import fetch_all
+from api_calls.ts_cache import (
+    CHUNK_WORKERS,
+    fetch_chunked,
+    merge_intervals,
+    split_range,
+    ts_cache,
+)
+
 load_dotenv()
 
 DATA_AGG_DIC = {"quart-horaire": "15 m", "horaire": "1 h"}
 
 
-def add_columns_info(
-    observations: pd.DataFrame,
+META_COLUMNS = [
+    "capteur_id",
+    "capteur_uid",
+    "ScanInterval",
+    "campaign_id",
+    "campaign_name",
+    "site_id",
+    "site_name",
+    "site_lon",
+    "site_lat",
+]
+
+# Dimension tables of the compact model: name -> (key, columns)
+DIMENSIONS = {
+    "devices": ("capteur_id", ["capteur_uid", "ScanInterval"]),
+    "campaigns": ("campaign_id", ["campaign_name"]),
+    "sites": ("site_id", ["site_name", "site_lon", "site_lat"]),
+}
+DIMENSION_KEYS = [key for key, _ in DIMENSIONS.values()]
+
+
+class MicrospotTables(NamedTuple):
+    """
+    Compact Microspot export
+
+    observations holds one row per observation, indexed by date: int32
+    device code, nullable Int32 campaign and site codes, float32 values and
+    categorical text fields (isoCode, unit). devices, campaigns and sites
+    are small dimension tables indexed by those codes, see join_metadata.
+    """
+
+    observations: pd.DataFrame
+    devices: pd.DataFrame
+    campaigns: pd.DataFrame
+    sites: pd.DataFrame
+
+
+def datastream_info(
     capteur_info: dict,
     campaign_info: dict,
-):
-    capteur_id = capteur_info["id"]
-    capteur_uid = capteur_info["uid"]
-    capteur_scaninterval = capteur_info["scanInterval"]
-
-    campaign_id = campaign_info["id"]
-    campaign_name = campaign_info["campaign.name"]
-    if "location" in campaign_info.index and campaign_info["location"] == None:
-        site_id = None
-        site_name = None
+) -> list:
+    """
+    Device and campaign metadata of a datastream, in META_COLUMNS order
+    """
+    location = campaign_info.get("location") or {}
+    position = location.get("position")
+    if isinstance(position, (list, tuple)) and len(position) >= 2:
+        site_lon = position[1]
+        site_lat = position[0]
+    else:
         site_lon = None
         site_lat = None
-    else:
-        site_id = campaign_info.get("location.id", None)
-        site_name = campaign_info.get("location.name", None)
-        position = campaign_info.get("location.position", None)
-        if isinstance(position, (list, tuple)) and len(position) >= 2:
-            site_lon = position[1]
-            site_lat = position[0]
-        else:
-            site_lon = None
-            site_lat = None
 
-    observations["capteur_id"] = capteur_id
-    observations["capteur_uid"] = capteur_uid
-    observations["ScanInterval"] = capteur_scaninterval
-    observations["campaign_id"] = campaign_id
-    observations["campaign_name"] = campaign_name
-    observations["site_id"] = site_id
-    observations["site_name"] = site_name
-    observations["site_lon"] = site_lon
-    observations["site_lat"] = site_lat
+    return [
+        capteur_info.get("id"),
+        capteur_info.get("uid"),
+        capteur_info.get("scanInterval"),
+        campaign_info.get("id"),
+        (campaign_info.get("campaign") or {}).get("name"),
+        location.get("id"),
+        location.get("name"),
+        site_lon,
+        site_lat,
+    ]
 
 
-def response_to_dataframe(
+def flatten_record(record: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, prefix=f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def response_to_tables(
     json_data: json,
-):
-    capteurs = pd.json_normalize(json_data)
-    data = pd.DataFrame()
-
-    for i_capteur in range(len(capteurs.index)):
-        campaigns = pd.json_normalize(capteurs.iloc[i_capteur]["datastreams"])
-        for i_campaign in range(len(campaigns.index)):
-            observations = pd.json_normalize(campaigns.iloc[i_campaign]["observations"])
-            add_columns_info(
-                observations=observations,
-                capteur_info=capteurs.iloc[i_capteur],
-                campaign_info=campaigns.iloc[i_campaign],
-            )
-            data = pd.concat([data, observations])
+) -> MicrospotTables:
+    """
+    Flatten a Microspot export (devices -> datastreams -> observations) into
+    the compact observations table and its dimension tables
 
-    # Only process if data is not empty and has 'happenedAt'
-    if data.empty or "happenedAt" not in data.columns:
-        return pd.DataFrame()
+    The JSON is walked once: each datastream's observation fields are written
+    as slices of column lists sized to the total number of observations, and
+    each column is built once with its compact dtype. Datastream metadata is
+    not repeated on the observations, only the device, campaign and site
+    codes are.
+    """
+    datastreams = [
+        (capteur, datastream)
+        for capteur in json_data or []
+        for datastream in capteur.get("datastreams") or []
+    ]
+    lengths = [
+        len(datastream.get("observations") or []) for _, datastream in datastreams
+    ]
+    n_obs = sum(lengths)
+    if n_obs == 0:
+        return empty_tables()
+
+    columns = {}
+    i_obs = 0
+    for (_, datastream), length in zip(datastreams, lengths):
+        observations = datastream.get("observations") or []
+        for key in dict.fromkeys(chain.from_iterable(observations)):
+            values = [observation.get(key) for observation in observations]
+            if isinstance(values[0], dict):
+                fields = pd.DataFrame(
+                    [flatten_record(value or {}) for value in values]
+                ).add_prefix(f"{key}.")
+            else:
+                fields = {key: values}
+            for field, field_values in fields.items():
+                column = columns.get(field)
+                if column is None:
+                    column = columns[field] = [None] * n_obs
+                column[i_obs : i_obs + length] = list(field_values)
+        i_obs += length
+
+    if "happenedAt" not in columns:
+        return empty_tables()
+
+    meta = pd.DataFrame(
+        [datastream_info(capteur, datastream) for capteur, datastream in datastreams],
+        columns=META_COLUMNS,
+    )
+
+    dates = columns.pop("happenedAt")
+    data = {field: compact_column(values) for field, values in columns.items()}
+    data["capteur_id"] = np.repeat(
+        meta["capteur_id"].fillna(-1).to_numpy(dtype=np.int32), lengths
+    )
+    for key in ["campaign_id", "site_id"]:
+        data[key] = pd.array(np.repeat(meta[key].to_numpy(), lengths), dtype="Int32")
+    data = pd.DataFrame(data)
+    data.index = pd.to_datetime(
+        dates, errors="coerce", utc=True, format="ISO8601"
+    ).tz_localize(None)
+    data.index.name = "date"
+    data = data[data.index.notna()]
+
+    return MicrospotTables(
+        data,
+        **{
+            name: meta.drop_duplicates(key, keep="last").set_index(key)[info]
+            for name, (key, info) in DIMENSIONS.items()
+        },
+    )
+
+
+def compact_column(values: list):
+    """
+    float32 array for numeric observation fields, categorical otherwise
+    """
+    if pd.api.types.infer_dtype(values, skipna=True) in [
+        "integer",
+        "floating",
+        "mixed-integer-float",
+        "empty",
+    ]:
+        return np.array(values, dtype=np.float32)
+    return pd.Categorical(values)
 
-    data.rename(columns={"happenedAt": "date"}, inplace=True)
-    data["date"] = pd.to_datetime(data["date"], errors="coerce", utc=True)
-    data["date"] = data["date"].dt.tz_convert("UTC").dt.tz_localize(None)
-    data = data.dropna(subset=["date"])
-    data.reset_index(inplace=True)
-    data.set_index("date", inplace=True)
 
+def empty_tables() -> MicrospotTables:
+    return MicrospotTables(
+        pd.DataFrame(),
+        **{
+            name: pd.DataFrame(columns=info, index=pd.Index([], name=key))
+            for name, (key, info) in DIMENSIONS.items()
+        },
+    )
+
+
+def join_metadata(
+    tables: MicrospotTables,
+    columns: list = META_COLUMNS,
+) -> pd.DataFrame:
+    """
+    Observations with the requested metadata columns looked up in the
+    dimension tables: text columns come back categorical, so a site name
+    costs one small integer code per row
+    """
+    observations = tables.observations
+    if observations.empty:
+        return observations
+    looked_up = {}
+    for name, (key, info) in DIMENSIONS.items():
+        table = getattr(tables, name)
+        for col in info:
+            if col not in columns:
+                continue
+            values = table[col]
+            if values.dtype == object:
+                values = values.astype("category")
+            looked_up[col] = values.reindex(observations[key].to_numpy()).array
+    data = observations.assign(**looked_up)
+    fields = [col for col in observations.columns if col not in DIMENSION_KEYS]
+    return data[fields + [col for col in META_COLUMNS if col in data.columns]]
+
+
+def merge_dimension(cached: pd.DataFrame, table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows of table added to, or replacing, the cached dimension rows
+    """
+    if cached.empty:
+        return table
+    merged = pd.concat([cached, table])
+    return merged[~merged.index.duplicated(keep="last")]
+
+
+def concat_observations(frames: list) -> pd.DataFrame:
+    """
+    pd.concat of observation frames, keeping text fields categorical when
+    their categories differ
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    data = pd.concat(frames)
+    for col in data.columns[data.dtypes == object]:
+        data[col] = data[col].astype("category")
     return data
 
 
+def widen_float32(values: pd.Series) -> pd.Series:
+    """
+    float32 values as float64 rounded to the 7 significant digits float32
+    holds: 18.99 stored as float32 reads back as 18.99 rather than
+    18.989999771118164
+    """
+    values = values.astype("float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values.to_numpy())))
+    scale = 10.0 ** (6 - np.nan_to_num(magnitude, nan=0, neginf=0))
+    return values.where(values == 0, np.round(values * scale) / scale)
+
+
+def response_to_dataframe(
+    json_data: json,
+    columns: list = META_COLUMNS,
+) -> pd.DataFrame:
+    """
+    Microspot export as one row per observation, indexed by date, with the
+    metadata columns joined (see response_to_tables)
+    """
+    return join_metadata(response_to_tables(json_data), columns)
+
+
 def request_microspot(
     aggregation: str,
     studies: list = [],
@@ -90,8 +284,104 @@ def request_microspot(
         "Authorization": f"Bearer {os.getenv('MICROSPOT_REQUEST_KEY')}",
         "Content-Type": "application/json",
     },
+    metadata: list = META_COLUMNS,
 ):
-    
+    """
+    Microspot observations of the given devices, read from the local
+    time series cache where possible, with the metadata columns joined
+
+    Only the sub-intervals of dateRange missing for at least one
+    (device, pollutant) pair are requested, for all devices at once and
+    split in calendar chunks fetched concurrently (see split_range).
+    Requests by study or campaign, or for all devices, bypass the cache but
+    are chunked too. The cache holds the compact observations and the
+    dimension tables (see response_to_tables), joined once at the end.
+    """
+    fetch = partial(
+        fetch_microspot,
+        aggregation=aggregation,
+        studies=studies,
+        campaigns=campaigns,
+        observationTypeCodes=observationTypeCodes,
+        devices=devices,
+        url=url,
+        headers=headers,
+    )
+
+    def request(chunk_start: pd.Timestamp, chunk_end: pd.Timestamp) -> MicrospotTables:
+        return fetch(
+            dateRange=[
+                f"{chunk_start.isoformat()}+00:00",
+                f"{chunk_end.isoformat()}+00:00",
+            ]
+        )
+
+    start, end = dateRange
+    if not devices or studies or campaigns or not ts_cache.enabled:
+        return fetch_chunked(
+            lambda chunk_start, chunk_end: join_metadata(
+                request(chunk_start, chunk_end), metadata
+            ),
+            start,
+            end,
+        )
+
+    keys = {
+        (device, str(code)): ("microspot-obs", device, code, aggregation)
+        for device in devices
+        for code in observationTypeCodes
+    }
+    gaps = merge_intervals(
+        [gap for key in keys.values() for gap in ts_cache.missing(key, start, end)]
+    )
+
+    def fetch_chunk(chunk_start: pd.Timestamp, chunk_end: pd.Timestamp, inclusive):
+        tables = request(chunk_start, chunk_end)
+        for name in DIMENSIONS:
+            ts_cache.update(
+                ("microspot-meta", name),
+                chunk_start,
+                chunk_end,
+                partial(merge_dimension, table=getattr(tables, name)),
+            )
+        data = tables.observations
+        for (device, code), key in keys.items():
+            if not data.empty:
+                rows = data[
+                    (data["capteur_id"] == device)
+                    & (data["isoCode"].astype(str) == code)
+                ]
+            else:
+                rows = data
+            ts_cache.store(key, chunk_start, chunk_end, rows, inclusive)
+
+    # Chunks are stored as they arrive
+    chunks = [chunk for gap in gaps for chunk in split_range(*gap)]
+    fetch_all(
+        {f"{chunk[0]}/{chunk[1]}": partial(fetch_chunk, *chunk) for chunk in chunks},
+        max_workers=CHUNK_WORKERS,
+    )
+
+    tables = MicrospotTables(
+        concat_observations([ts_cache.load(key, start, end) for key in keys.values()]),
+        **{
+            name: ts_cache.read(("microspot-meta", name))["data"] for name in DIMENSIONS
+        },
+    )
+    return join_metadata(tables, metadata)
+
+
+def fetch_microspot(
+    aggregation: str,
+    studies: list,
+    campaigns: list,
+    observationTypeCodes: list,
+    devices: list[int],
+    dateRange: list,
+    url: str,
+    headers: dict,
+) -> MicrospotTables:
+
     json_data = {
         "studies": studies,
         "campaigns": campaigns,
@@ -101,5 +391,5 @@ def request_microspot(
         "dateRange": dateRange,
     }
 
-    response = requests.post(url, json=json_data, headers=headers).json()
-    return response_to_dataframe(response)
+    response = http_client.post(url, json=json_data, headers=headers).json()
+    return response_to_tables(response)
@@ -0,0 +1,128 @@
+import pandas as pd
+
+from api_calls.microspot_api import request_microspot
+from api_calls.ts_cache import ts_cache, to_timestamp
+from api_calls.xair import ISO
+
+CATALOG_KEYS = ["capteur_id", "campaign_id", "site_id", "isoCode"]
+CATALOG_INFO = [
+    "capteur_uid",
+    "campaign_name",
+    "site_name",
+    "site_lon",
+    "site_lat",
+]
+
+
+def summarize_observations(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per device, campaign, site and pollutant with its metadata and
+    the first/last observation dates
+    """
+    if data.empty:
+        return pd.DataFrame(columns=CATALOG_KEYS + CATALOG_INFO + ["start", "end"])
+    # Categorical metadata (see join_metadata) is kept as plain values here
+    data = data.assign(
+        date=data.index,
+        isoCode=data["isoCode"].astype(str),
+        **{
+            col: data[col].astype(object)
+            for col in CATALOG_INFO
+            if isinstance(data[col].dtype, pd.CategoricalDtype)
+        },
+    )
+    return (
+        data.groupby(CATALOG_KEYS, dropna=False, sort=False)
+        .agg(
+            **{col: (col, "first") for col in CATALOG_INFO},
+            start=("date", "min"),
+            end=("date", "max"),
+        )
+        .reset_index()
+    )
+
+
+def merge_catalog(cached: pd.DataFrame, summary: pd.DataFrame) -> pd.DataFrame:
+    frames = [frame for frame in [cached, summary] if not frame.empty]
+    if not frames:
+        return summary
+    return (
+        pd.concat(frames, ignore_index=True)
+        .groupby(CATALOG_KEYS, dropna=False, sort=False)
+        .agg(
+            **{col: (col, "last") for col in CATALOG_INFO},
+            start=("start", "min"),
+            end=("end", "max"),
+        )
+        .reset_index()
+    )
+
+
+class MicrospotCatalog:
+    """
+    Index of Microspot devices, campaigns, sites, coordinates and active
+    periods, per pollutant of ISO
+
+    Each pollutant index lives in the time series cache under its own key:
+    scanned intervals are recorded as its coverage, so only the intervals
+    never scanned (or the recent, expired ones) are requested from
+    Microspot, for that pollutant only.
+    """
+
+    def __init__(self, cache=ts_cache):
+        self.cache = cache
+
+    def key(self, polluant: str) -> tuple:
+        return ("catalog", "microspot", ISO[polluant])
+
+    def request(
+        self, polluant: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> pd.DataFrame:
+        return summarize_observations(
+            request_microspot(
+                aggregation="horaire",
+                observationTypeCodes=[ISO[polluant]],
+                dateRange=[f"{start.isoformat()}+00:00", f"{end.isoformat()}+00:00"],
+            )
+        )
+
+    def scan(self, polluant: str, start, end):
+        """
+        Index the observations of polluant by all devices for the intervals
+        of [start, end] not scanned yet
+
+        Nothing is locked during the requests: concurrent scans of the same
+        interval merge the same summary twice, which changes nothing.
+        """
+        key = self.key(polluant)
+        for gap_start, gap_end in self.cache.missing(key, start, end):
+            summary = self.request(polluant, gap_start, gap_end)
+            self.cache.update(
+                key,
+                gap_start,
+                gap_end,
+                lambda cached: merge_catalog(cached, summary),
+            )
+
+    def sites(self, polluant: str, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Devices measuring polluant with observations between start_date and
+        end_date, scanning that interval first if it is not indexed yet
+        (the cache warmer keeps the default window indexed)
+        """
+        start, end = to_timestamp(start_date), to_timestamp(end_date)
+        if self.cache.enabled:
+            self.scan(polluant, start, end)
+            table = self.cache.read(self.key(polluant))["data"]
+        else:
+            table = self.request(polluant, start, end)
+        if table.empty:
+            return table
+        return table[
+            (table["start"] <= end)
+            & (table["end"] >= start)
+            & table["site_name"].notna()
+        ]
+
+
+microspot_catalog = MicrospotCatalog()
@@ -0,0 +1,307 @@
+import os
+import pickle
+import re
+import tempfile
+import threading
+from functools import partial
+from typing import Callable
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from api_calls.fan_out import fetch_all
+
+load_dotenv()
+
+CACHE_DIR = os.getenv("MICAEXP_CACHE_DIR", "data/cache")
+# Data younger than this at fetch time may still be corrected upstream...
+VALIDATION_DELAY = pd.Timedelta(
+    days=float(os.getenv("MICAEXP_CACHE_VALIDATION_DAYS", 3))
+)
+# ...and is only reused for this long before being requested again
+RECENT_TTL = pd.Timedelta(minutes=float(os.getenv("MICAEXP_CACHE_RECENT_TTL_MIN", 15)))
+# Long ranges are requested in chunks cut at these calendar boundaries
+# (pandas frequency, month starts by default), a few at a time
+CHUNK_FREQ = os.getenv("MICAEXP_CHUNK_FREQ", "MS")
+CHUNK_WORKERS = int(os.getenv("MICAEXP_CHUNK_WORKERS", 4))
+
+
+def to_timestamp(date: str) -> pd.Timestamp:
+    """
+    Naive UTC timestamp, like the index of the fetched frames
+    """
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+    return timestamp
+
+
+class TimeSeriesCache:
+    """
+    On-disk cache of time series segments, keyed by e.g.
+    (source, device or measure id, pollutant, aggregation)
+
+    Each key is stored as one pickle holding the cached rows and the list of
+    (start, end, expires) intervals they cover. Settled intervals never
+    expire; intervals closer than validation_delay to their fetch time expire
+    after recent_ttl so not-yet-validated data is refreshed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = CACHE_DIR,
+        validation_delay: pd.Timedelta = VALIDATION_DELAY,
+        recent_ttl: pd.Timedelta = RECENT_TTL,
+    ):
+        self.cache_dir = cache_dir
+        self.validation_delay = validation_delay
+        self.recent_ttl = recent_ttl
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.cache_dir)
+
+    def lock(self, key: tuple) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _reset_after_fork(self):
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def path(self, key: tuple) -> str:
+        name = re.sub(r"[^\w.-]+", "_", "_".join(str(part) for part in key))
+        return os.path.join(self.cache_dir, f"{name}.pkl")
+
+    def read(self, key: tuple) -> dict:
+        try:
+            with open(self.path(key), "rb") as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return {"coverage": [], "data": pd.DataFrame()}
+
+    def write(self, key: tuple, entry: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Atomic replace: concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path(key))
+
+    def valid_coverage(self, entry: dict) -> list[tuple]:
+        now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        return sorted(
+            (start, end)
+            for start, end, expires in entry["coverage"]
+            if expires is None or expires > now
+        )
+
+    def missing(self, key: tuple, start, end) -> list[tuple]:
+        """
+        Sub-intervals of [start, end] not covered by the cache
+        """
+        start, end = to_timestamp(start), to_timestamp(end)
+        if not self.enabled:
+            return [(start, end)]
+
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in self.valid_coverage(self.read(key)):
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def load(self, key: tuple, start, end) -> pd.DataFrame:
+        data = self.read(key)["data"]
+        if data.empty:
+            return data
+        return data[
+            (data.index >= to_timestamp(start)) & (data.index <= to_timestamp(end))
+        ]
+
+    def store(
+        self,
+        key: tuple,
+        start,
+        end,
+        data: pd.DataFrame,
+        inclusive: str = "both",
+    ):
+        """
+        Replace the cached rows of [start, end] with data and mark the
+        interval as covered
+
+        With inclusive="left" the rows at end are left to the next chunk:
+        they are neither replaced nor taken from data.
+        """
+        start, end = to_timestamp(start), to_timestamp(end)
+        if inclusive == "left" and not data.empty:
+            data = data[data.index < end]
+
+        def replace_rows(cached: pd.DataFrame) -> pd.DataFrame:
+            if not cached.empty:
+                after = (
+                    cached.index >= end if inclusive == "left" else cached.index > end
+                )
+                cached = cached[(cached.index < start) | after]
+            frames = [frame for frame in [cached, data] if not frame.empty]
+            return pd.concat(frames).sort_index(kind="stable") if frames else data
+
+        self.update(key, start, end, replace_rows)
+
+    def update(
+        self,
+        key: tuple,
+        start,
+        end,
+        merge: Callable[[pd.DataFrame], pd.DataFrame],
+    ):
+        """
+        Replace the cached data by merge(cached data) and mark [start, end]
+        as covered
+        """
+        if not self.enabled:
+            return
+        start, end = to_timestamp(start), to_timestamp(end)
+        fetched_at = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        settled_end = min(end, (fetched_at - self.validation_delay).floor("D"))
+
+        with self.lock(key):
+            entry = self.read(key)
+            entry["data"] = merge(entry["data"])
+
+            coverage = [
+                (covered_start, covered_end, expires)
+                for covered_start, covered_end, expires in entry["coverage"]
+                if expires is None or expires > fetched_at
+            ]
+            if settled_end >= start:
+                coverage.append((start, settled_end, None))
+            if settled_end < end:
+                coverage.append(
+                    (max(start, settled_end), end, fetched_at + self.recent_ttl)
+                )
+            entry["coverage"] = merge_settled(coverage)
+            self.write(key, entry)
+
+    def fetch(
+        self,
+        key: tuple,
+        start,
+        end,
+        fetch: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """
+        Cached rows of [start, end], requesting only the missing sub-intervals
+        through fetch(chunk_start, chunk_end), cut in split_range chunks that
+        are fetched concurrently
+        """
+        if not self.enabled:
+            return fetch_chunked(fetch, start, end)
+
+        def fetch_chunk(chunk_start, chunk_end, inclusive):
+            data = fetch(chunk_start, chunk_end)
+            self.store(key, chunk_start, chunk_end, data, inclusive)
+
+        # Chunks are stored as they arrive
+        chunks = [
+            chunk
+            for gap in self.missing(key, start, end)
+            for chunk in split_range(*gap)
+        ]
+        fetch_all(
+            {
+                f"{chunk[0]}/{chunk[1]}": partial(fetch_chunk, *chunk)
+                for chunk in chunks
+            },
+            max_workers=CHUNK_WORKERS,
+        )
+        return self.load(key, start, end)
+
+
+def split_range(start, end, freq: str = CHUNK_FREQ) -> list[tuple]:
+    """
+    [start, end] cut at the calendar boundaries of freq, so a range is
+    always requested in the same chunks whatever the query it belongs to
+
+    return :
+    --------
+        chunks : list
+            (chunk_start, chunk_end, inclusive) tuples. Consecutive chunks
+            share their boundary, it belongs to the later one: inclusive is
+            "left" for every chunk but the last, "both".
+    """
+    start, end = to_timestamp(start), to_timestamp(end)
+    bounds = [
+        bound for bound in pd.date_range(start, end, freq=freq) if start < bound < end
+    ]
+    edges = [start] + bounds + [end]
+    return [
+        (chunk_start, chunk_end, "left" if chunk_end < end else "both")
+        for chunk_start, chunk_end in zip(edges[:-1], edges[1:])
+    ]
+
+
+def fetch_chunked(
+    fetch: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame],
+    start,
+    end,
+) -> pd.DataFrame:
+    """
+    fetch(start, end) run concurrently on the split_range chunks of
+    [start, end], and the chunks concatenated in time order
+
+    The rows at a boundary shared by two chunks are taken from the later
+    chunk.
+    """
+    chunks = split_range(start, end)
+    fetched = fetch_all(
+        {str(i): partial(fetch, *chunk[:2]) for i, chunk in enumerate(chunks)},
+        max_workers=CHUNK_WORKERS,
+    )
+    frames = []
+    for i, (_, chunk_end, inclusive) in enumerate(chunks):
+        frame = fetched[str(i)]
+        if inclusive == "left" and not frame.empty:
+            frame = frame[frame.index < chunk_end]
+        if not frame.empty:
+            frames.append(frame)
+    return pd.concat(frames) if frames else fetched["0"]
+
+
+def merge_intervals(intervals: list[tuple]) -> list[tuple]:
+    """
+    Union of overlapping or touching (start, end) intervals
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def merge_settled(coverage: list[tuple]) -> list[tuple]:
+    """
+    Merge the settled intervals of a coverage list, keep expiring ones as is
+    """
+    settled = merge_intervals(
+        [(start, end) for start, end, expires in coverage if expires is None]
+    )
+    return [(start, end, None) for start, end in settled] + [
+        interval for interval in coverage if interval[2] is not None
+    ]
+
+
+ts_cache = TimeSeriesCache()
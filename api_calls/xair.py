@@ -1,9 +1,17 @@
 import os
+import threading
+import time
 import warnings
-import requests
 import datetime as dt
 import pandas as pd
 import numpy as np
+from functools import partial
+from dotenv import load_dotenv
+
+from api_calls.http_client import http_client
+from api_calls.ts_cache import ts_cache
+
+load_dotenv()
 
 ISO = {
     "PM10": "24",
@@ -107,6 +115,10 @@ URL_DICT = {
     "measures": "https://172.16.13.224:8443/dms-api/public/v2/measures?",
 }
 
+# dms-api is served on the internal network with a self-signed certificate
+for url in URL_DICT.values():
+    http_client.skip_verify(url)
+
 DATA_KEYS = {
     "data": "data",
     "sites": "sites",
@@ -123,6 +135,23 @@ DATA_KEYS = {
 
 DATATYPES = {"quart-horaire": "base", "horaire": "hourly"}
 
+AORP_STATES = ["A", "O", "R", "P"]
+
+PHYSICALS_CSV = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "physicals.csv",
+)
+
+# XR sites, measures and physicals change a few times a year
+CATALOG_TTL = float(os.getenv("MICAEXP_XR_CATALOG_TTL_H", 24)) * 3600
+
+MEASURE_ID_PREFIXES = {
+    "24": "PC",
+    "39": "P2",
+    "68": "PM1",
+}
+
 
 def wrap_xair_request(
     fromtime: str,
@@ -133,17 +162,35 @@ def wrap_xair_request(
     datatype: str = "hourly",
 ) -> pd.DataFrame:
 
-    xair_site_measures = request_xr(
-        folder=DATA_KEYS["measures"],
-        sites=sites,
-        physicals=physicals,
+    fromtime, totime = format_time_for_xair(fromtime, totime)
+
+    # Only the days missing from the local cache are requested from XR
+    return ts_cache.fetch(
+        key=("xr", sites, physicals, datatype),
+        start=fromtime,
+        end=totime,
+        fetch=partial(
+            fetch_xair_data,
+            sites=sites,
+            physicals=physicals,
+            datatype=datatype,
+        ),
     )
 
-    fromtime, totime = format_time_for_xair(fromtime, totime)
+
+def fetch_xair_data(
+    fromtime: pd.Timestamp,
+    totime: pd.Timestamp,
+    sites: list[str,],
+    physicals: list[str,],
+    datatype: str = "hourly",
+) -> pd.DataFrame:
+
+    xair_site_measures = xr_catalog.measures(sites=sites, physicals=physicals)
 
     xair_data_raw = request_xr(
-        fromtime=fromtime,
-        totime=totime,
+        fromtime=fromtime.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        totime=totime.strftime("%Y-%m-%dT%H:%M:%SZ"),
         folder=DATA_KEYS["data"],
         measures=",".join(xair_site_measures["id"].to_list()),
         datatype=DATATYPES[datatype],
@@ -255,35 +302,33 @@ def request_xr(
         f"physicals={physicals}&"
     )
     print(url)
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore")
-
-        request_data = requests.get(url, verify=False).json()[DATA_KEYS[folder]]
-
-        if folder == "data":
-            if datatype == "base":
-                data = pd.json_normalize(
-                    data=request_data,
-                    record_path=JSON_PATH_LISTS["data_base"]["record_path"],
-                    meta=JSON_PATH_LISTS["data_base"]["meta"],
-                )
-            if datatype == "hourly":
-                data = pd.json_normalize(
-                    data=request_data,
-                    record_path=JSON_PATH_LISTS["data_hour"]["record_path"],
-                    meta=JSON_PATH_LISTS["data_hour"]["meta"],
-                )
-
-        else:
+
+    request_data = http_client.get(url).json()[DATA_KEYS[folder]]
+
+    if folder == "data":
+        if datatype == "base":
             data = pd.json_normalize(
                 data=request_data,
-                record_path=JSON_PATH_LISTS[folder]["record_path"],
-                meta=JSON_PATH_LISTS[folder]["meta"],
+                record_path=JSON_PATH_LISTS["data_base"]["record_path"],
+                meta=JSON_PATH_LISTS["data_base"]["meta"],
+            )
+        if datatype == "hourly":
+            data = pd.json_normalize(
+                data=request_data,
+                record_path=JSON_PATH_LISTS["data_hour"]["record_path"],
+                meta=JSON_PATH_LISTS["data_hour"]["meta"],
             )
 
-        for col in data.columns:
-            if col not in list(HEADER_RENAME_LISTS[folder].keys()):
-                data[col] = np.nan
+    else:
+        data = pd.json_normalize(
+            data=request_data,
+            record_path=JSON_PATH_LISTS[folder]["record_path"],
+            meta=JSON_PATH_LISTS[folder]["meta"],
+        )
+
+    for col in data.columns:
+        if col not in list(HEADER_RENAME_LISTS[folder].keys()):
+            data[col] = np.nan
 
     return data.rename(columns=HEADER_RENAME_LISTS[folder])
 
@@ -341,30 +386,84 @@ def add_poll_info(
 
 def mask_aorp(data):
 
-    data["value"] = data.apply(
-        lambda row: (
-            np.nan if row["state"] not in ["A", "O", "R", "P"] else row["value"]
-        ),
-        axis=1,
-    )
+    data["value"] = data["value"].where(data["state"].isin(AORP_STATES))
     return data[["id", "value", "unit"]]
 
 
-
 def mask_duplicates(
     data: pd.DataFrame,
     site_name: str,
     poll_iso: str,
 ):
-    if poll_iso == "24":
-        data_out = data[data["id"].str.contains(f"PC{site_name[:2]}")]
-    if poll_iso == "39":
-        data_out = data[data["id"].str.contains(f"P2{site_name[:2]}")]
-    if poll_iso == "68":
-        for id in data.id.unique():
-            if f"PM1{site_name[:2]}".lower() in str(id).lower():
-                data_out = data[data["id"].str.contains(f"PM1{site_name[:2]}")]
-                break
-            else:
-                data_out = data[data["id"] == data["id"].unique()[0]]
-    return data_out
+    if poll_iso not in MEASURE_ID_PREFIXES:
+        return data
+
+    # Select on the (few) distinct measure ids, then mask the rows once
+    ids = pd.Series(data["id"].unique(), dtype=object)
+    pattern = f"{MEASURE_ID_PREFIXES[poll_iso]}{site_name[:2]}"
+    has_pattern = ids.astype(str).str.lower().str.contains(pattern.lower(), regex=False)
+    if poll_iso == "68" and not has_pattern.any():
+        selected_ids = ids.iloc[:1]
+    else:
+        selected_ids = ids[ids.str.contains(pattern)]
+    return data[data["id"].isin(selected_ids)]
+
+
+class XrCatalog:
+    """
+    In-process TTL cache of the XR sites, measures and physicals metadata
+
+    Each distinct request is kept for ttl seconds. Physicals are seeded from
+    data/physicals.csv, sites are fetched once for all sites and filtered
+    locally.
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL, physicals_csv: str = PHYSICALS_CSV):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        if os.path.exists(physicals_csv):
+            physicals = pd.read_csv(physicals_csv, index_col=0, dtype={"id": str})
+            self._entries[("physicals",)] = (
+                time.monotonic(),
+                physicals.rename(columns=HEADER_RENAME_LISTS["physicals"]),
+            )
+
+    def get(self, folder: str, **params) -> pd.DataFrame:
+        key = (folder,) + tuple(sorted(params.items()))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        # Not locked during the request: concurrent misses may both request
+        # the same metadata, which is cheap and rare
+        entry = (time.monotonic(), request_xr(folder=folder, **params))
+        with self._lock:
+            self._entries[key] = entry
+        return entry[1]
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+
+    def measures(
+        self, sites: str = "", physicals: str = "", groups: str = ""
+    ) -> pd.DataFrame:
+        return self.get(
+            DATA_KEYS["measures"], sites=sites, physicals=physicals, groups=groups
+        )
+
+    def sites(self, sites: str = "") -> pd.DataFrame:
+        all_sites = self.get(DATA_KEYS["sites"])
+        if not sites:
+            return all_sites
+        site_info = all_sites[all_sites["id"].astype(str) == str(sites)]
+        if site_info.empty:
+            site_info = self.get(DATA_KEYS["sites"], sites=sites)
+        return site_info
+
+    def physicals(self) -> pd.DataFrame:
+        return self.get(DATA_KEYS["physicals"])
+
+
+xr_catalog = XrCatalog()
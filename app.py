@@ -1,7 +1,17 @@
+import os
+import threading
+
 from dash import html, dcc
 from src.layout.sidebar import get_sidebar
 from src.layout.content import get_content
 from maindash import app
+from src.utils.warmer import cache_warmer
+from src.utils.export import (
+    EXPORT_ROUTE,
+    METADATA_ROUTE,
+    export_data,
+    export_metadata_view,
+)
 
 app.layout = html.Div(
     [
@@ -12,7 +22,33 @@ app.layout = html.Div(
 )
 
 server = app.server
+server.add_url_rule(EXPORT_ROUTE, view_func=export_data)
+server.add_url_rule(METADATA_ROUTE, view_func=export_metadata_view)
+
+background_started = threading.Event()
+background_lock = threading.Lock()
 
-if __name__ == "__main__":
 
+def start_background_tasks():
+    """
+    Start the cache warm-up thread of the serving process, once
+
+    Called by the server entry points as the server starts (below for the
+    dev server, gunicorn.conf.py for gunicorn), so the first user does not
+    wait on the upstream APIs. Not at import: the background job processes
+    import this module too, and preloading servers fork their workers from
+    the process that imported it.
+    """
+    with background_lock:
+        if background_started.is_set():
+            return
+        background_started.set()
+    cache_warmer.start_background_warm()
+
+
+if __name__ == "__main__":
+    # The debug reloader runs this script in a watcher process and in the
+    # serving child it restarts on changes (WERKZEUG_RUN_MAIN=true)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_tasks()
     app.run(debug=True)
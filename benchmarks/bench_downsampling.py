@@ -0,0 +1,60 @@
+"""
+Figure payload size and build time of the time series and 24h rolling
+average figures, with and without min/max downsampling
+
+    python -m benchmarks.bench_downsampling
+"""
+
+import time
+
+from benchmarks.payloads import graph_frame
+from src.layout.content_utils.make_24h_avg import make_24h_avg
+from src.layout.content_utils.make_timeseries import make_timeseries
+from src.utils.downsample import MAX_POINTS
+from src.utils.fonctions import get_color_map
+
+SCALES = [
+    # n_sensors, n_days, aggregation
+    (3, 5, "horaire"),
+    (10, 30, "quart-horaire"),
+    (9, 182, "quart-horaire"),
+]
+BUILDERS = {"timeseries": make_timeseries, "avg24h": make_24h_avg}
+
+
+def build(builder, graph_data, aggregation, max_points):
+    start = time.perf_counter()
+    fig = builder(
+        graph_data,
+        get_color_map(graph_data.columns),
+        aggregation,
+        "PM10",
+        "Station",
+        show_thresholds=True,
+        max_points=max_points,
+    )
+    payload = fig.to_json()
+    return len(payload), time.perf_counter() - start
+
+
+def main():
+    print(f"max points per trace: {MAX_POINTS}")
+    print(
+        f"{'figure':<12}{'scale':<28}{'points':>9}"
+        f"{'full kB':>10}{'full s':>8}{'down kB':>10}{'down s':>8}"
+    )
+    for n_sensors, n_days, aggregation in SCALES:
+        graph_data = graph_frame(n_sensors, n_days, aggregation)
+        for name, builder in BUILDERS.items():
+            full_size, full_time = build(builder, graph_data, aggregation, 0)
+            down_size, down_time = build(builder, graph_data, aggregation, MAX_POINTS)
+            scale = f"{n_sensors + 1} cols x {n_days} d {aggregation}"
+            print(
+                f"{name:<12}{scale:<28}{graph_data.size:>9}"
+                f"{full_size / 1e3:>10.0f}{full_time:>8.2f}"
+                f"{down_size / 1e3:>10.0f}{down_time:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Size, write and read time of the export formats, read as the notebooks
+do (dates parsed back into a DatetimeIndex)
+
+    python -m benchmarks.bench_export
+"""
+
+import gzip
+import io
+import time
+
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from benchmarks.payloads import graph_frame
+from src.utils.export import arrow_table, csv_chunks, gzip_chunks
+
+METADATA = {"polluant": "PM10", "aggregation": "quart-horaire", "columns": []}
+
+
+def write_csv(data):
+    return "".join(csv_chunks(data)).encode()
+
+
+def write_csv_gz(data):
+    return b"".join(gzip_chunks(csv_chunks(data)))
+
+
+def write_parquet(data):
+    buffer = io.BytesIO()
+    pq.write_table(arrow_table(data, METADATA), buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def write_feather(data):
+    buffer = io.BytesIO()
+    feather.write_feather(arrow_table(data, METADATA), buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def read_csv(payload):
+    return pd.read_csv(io.BytesIO(payload), sep=";", index_col=0, parse_dates=True)
+
+
+def read_csv_gz(payload):
+    return read_csv(gzip.decompress(payload))
+
+
+FORMATS = {
+    "csv": (write_csv, read_csv),
+    "csv.gz": (write_csv_gz, read_csv_gz),
+    "parquet": (write_parquet, lambda payload: pd.read_parquet(io.BytesIO(payload))),
+    "feather": (write_feather, lambda payload: pd.read_feather(io.BytesIO(payload))),
+}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    # Measures come with one decimal
+    data = graph_frame(n_sensors=10, n_days=365, aggregation="quart-horaire").round(1)
+    print(f"{data.shape[0]} rows x {data.shape[1]} columns")
+    print(f"{'format':<10}{'MB':>8}{'write s':>9}{'read s':>8}")
+    for name, (write, read) in FORMATS.items():
+        payload, write_time = timed(write, data)
+        frame, read_time = timed(read, payload)
+        pd.testing.assert_frame_equal(frame, data, check_freq=False, check_names=False)
+        print(
+            f"{name:<10}{len(payload) / 1e6:>8.1f}{write_time:>9.2f}{read_time:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Import time of the dashboard, measured with python -X importtime in a
+fresh interpreter, as paid by every new gunicorn worker
+
+Fails when one of the LAZY_MODULES is imported at start-up, or when the
+best import time exceeds the optional budget (in seconds).
+
+    python -m benchmarks.bench_import [module] [budget]
+"""
+
+import subprocess
+import sys
+
+MODULE = "app"
+REPEAT = 3
+TOP = 15
+# Only needed on first use (exports) or not needed by the dashboard at all
+LAZY_MODULES = [
+    "geopandas",
+    "shapely",
+    "pyproj",
+    "scipy",
+    "matplotlib",
+    "rasterio",
+    "pyarrow.parquet",
+    "pyarrow.feather",
+]
+
+
+def import_times(module: str) -> dict:
+    """
+    Cumulative import time in seconds of each module imported by module,
+    from a fresh interpreter
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else MODULE
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    runs = [import_times(module) for _ in range(REPEAT)]
+    best = min(runs, key=lambda times: times[module])
+    print(
+        f"import {module}: best {best[module]:.3f} s, "
+        f"worst {max(times[module] for times in runs):.3f} s"
+    )
+    print(f"{'module':<48}{'cumulative s':>13}")
+    for name, seconds in sorted(best.items(), key=lambda item: -item[1])[1 : TOP + 1]:
+        print(f"{name:<48}{seconds:>13.3f}")
+
+    eager = [name for name in LAZY_MODULES if name in best]
+    if eager:
+        sys.exit(f"imported at start-up: {', '.join(eager)}")
+    if budget is not None and best[module] > budget:
+        sys.exit(f"import {module} takes {best[module]:.3f} s, budget {budget} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Memory footprint of the Microspot observations: previous wide frame vs
+compact tables (response_to_tables) and the joined frame built from them
+
+    python -m benchmarks.bench_memory
+"""
+
+import pickle
+
+from api_calls.microspot_api import join_metadata, response_to_tables
+from benchmarks.bench_response_to_dataframe import legacy_response_to_dataframe
+from benchmarks.payloads import microspot_payload
+
+SCALES = [
+    # n_devices, n_days, aggregation, n_campaigns
+    (10, 30, "horaire", 2),
+    (50, 30, "quart-horaire", 3),
+    (20, 365, "horaire", 4),
+]
+
+
+def megabytes(frames) -> float:
+    return sum(frame.memory_usage(deep=True).sum() for frame in frames) / 1e6
+
+
+def main():
+    print(
+        f"{'scale':<32}{'rows':>9}{'wide MB':>9}{'tables MB':>11}"
+        f"{'joined MB':>11}{'pickle wide/tables MB':>23}"
+    )
+    for n_devices, n_days, aggregation, n_campaigns in SCALES:
+        payload = microspot_payload(
+            n_devices=n_devices,
+            n_days=n_days,
+            aggregation=aggregation,
+            n_campaigns=n_campaigns,
+        )
+        wide = legacy_response_to_dataframe(payload).drop(columns="index")
+        tables = response_to_tables(payload)
+        joined = join_metadata(tables)
+        pickled = [
+            len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)) / 1e6
+            for data in [wide, tables]
+        ]
+        scale = f"{n_devices} dev x {n_days} d {aggregation}"
+        print(
+            f"{scale:<32}{len(wide):>9}{megabytes([wide]):>9.1f}"
+            f"{megabytes(tables):>11.1f}{megabytes([joined]):>11.1f}"
+            f"{pickled[0]:>14.1f} / {pickled[1]:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark the single-pass Microspot parser against the previous
+json_normalize/concat implementation
+
+    python -m benchmarks.bench_response_to_dataframe
+"""
+
+import time
+
+import pandas as pd
+
+from api_calls.microspot_api import response_to_dataframe
+from benchmarks.payloads import microspot_payload
+
+SCALES = [
+    # n_devices, n_days, aggregation, n_campaigns
+    (1, 1, "quart-horaire", 1),
+    (10, 30, "horaire", 2),
+    (20, 365, "horaire", 4),
+    (50, 30, "quart-horaire", 3),
+]
+
+
+def legacy_add_columns_info(observations, capteur_info, campaign_info):
+    if "location" in campaign_info.index and campaign_info["location"] == None:
+        site_id = site_name = site_lon = site_lat = None
+    else:
+        site_id = campaign_info.get("location.id", None)
+        site_name = campaign_info.get("location.name", None)
+        position = campaign_info.get("location.position", None)
+        if isinstance(position, (list, tuple)) and len(position) >= 2:
+            site_lon = position[1]
+            site_lat = position[0]
+        else:
+            site_lon = site_lat = None
+
+    observations["capteur_id"] = capteur_info["id"]
+    observations["capteur_uid"] = capteur_info["uid"]
+    observations["ScanInterval"] = capteur_info["scanInterval"]
+    observations["campaign_id"] = campaign_info["id"]
+    observations["campaign_name"] = campaign_info["campaign.name"]
+    observations["site_id"] = site_id
+    observations["site_name"] = site_name
+    observations["site_lon"] = site_lon
+    observations["site_lat"] = site_lat
+
+
+def legacy_response_to_dataframe(json_data):
+    capteurs = pd.json_normalize(json_data)
+    data = pd.DataFrame()
+
+    for i_capteur in range(len(capteurs.index)):
+        campaigns = pd.json_normalize(capteurs.iloc[i_capteur]["datastreams"])
+        for i_campaign in range(len(campaigns.index)):
+            observations = pd.json_normalize(campaigns.iloc[i_campaign]["observations"])
+            legacy_add_columns_info(
+                observations=observations,
+                capteur_info=capteurs.iloc[i_capteur],
+                campaign_info=campaigns.iloc[i_campaign],
+            )
+            data = pd.concat([data, observations])
+
+    if data.empty or "happenedAt" not in data.columns:
+        return pd.DataFrame()
+
+    data.rename(columns={"happenedAt": "date"}, inplace=True)
+    data["date"] = pd.to_datetime(data["date"], errors="coerce", utc=True)
+    data["date"] = data["date"].dt.tz_convert("UTC").dt.tz_localize(None)
+    data = data.dropna(subset=["date"])
+    data.reset_index(inplace=True)
+    data.set_index("date", inplace=True)
+
+    return data
+
+
+def best_of(func, *args, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    print(f"{'scale':<32}{'rows':>10}{'legacy (s)':>12}{'new (s)':>10}{'speedup':>9}")
+    for n_devices, n_days, aggregation, n_campaigns in SCALES:
+        payload = microspot_payload(
+            n_devices=n_devices,
+            n_days=n_days,
+            aggregation=aggregation,
+            n_campaigns=n_campaigns,
+        )
+        new = response_to_dataframe(payload)
+        legacy = legacy_response_to_dataframe(payload).drop(columns="index")
+        # Same values, the new frame being float32 and categorical
+        pd.testing.assert_frame_equal(
+            new.astype({col: object for col in new.columns[new.dtypes == "category"]}),
+            legacy[new.columns],
+            check_dtype=False,
+            check_index_type=False,
+        )
+
+        legacy_time = best_of(legacy_response_to_dataframe, payload, repeat=1)
+        new_time = best_of(response_to_dataframe, payload)
+        scale = f"{n_devices} dev x {n_days} d {aggregation} x {n_campaigns} camp"
+        print(
+            f"{scale:<32}{len(new):>10}{legacy_time:>12.3f}{new_time:>10.3f}"
+            f"{legacy_time / new_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
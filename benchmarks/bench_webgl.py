@@ -0,0 +1,203 @@
+"""
+SVG (go.Scatter) vs WebGL (go.Scattergl) rendering time of the time series
+figure, to choose MICAEXP_WEBGL_THRESHOLD
+
+With --headless, each case is rendered to PNG by the headless Chromium of
+kaleido (pip install kaleido==0.2.1) and timed, the results are written as
+JSON to benchmarks/results/ and the smallest point count from which WebGL
+is faster is printed. That Chromium draws WebGL in software (SwiftShader),
+so on a machine with a GPU WebGL gets ahead earlier.
+
+Otherwise this writes one HTML page that draws every case with
+Plotly.newPlot, then redraws it after a zoom, and shows the timings in a
+table (and in the console as JSON), to open in the browsers the dashboard
+is used with.
+
+    python -m benchmarks.bench_webgl [--headless [--repeat 3]] [--output ...]
+"""
+
+import argparse
+import datetime as dt
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from plotly.offline import get_plotlyjs
+
+from benchmarks.payloads import graph_frame
+from src.layout.content_utils.make_timeseries import make_timeseries
+from benchmarks.suite import RESULTS_DIR, environment
+from src.utils.fonctions import WEBGL_THRESHOLD, get_color_map
+
+N_COLUMNS = 5
+POINTS = [1_000, 5_000, 10_000, 20_000, 50_000, 100_000, 200_000]
+MODES = ["svg", "webgl"]
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>SVG vs WebGL</title>
+<script>{plotlyjs}</script></head>
+<body>
+<p>Threshold in use: {threshold} points</p>
+<table border="1" id="results">
+<tr><th>points</th><th>mode</th><th>draw (ms)</th><th>zoom (ms)</th></tr>
+</table>
+<div id="plot" style="width:1200px;height:500px"></div>
+<script>
+const cases = {cases};
+const frame = () => new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(resolve)));
+(async () => {{
+  const results = [];
+  for (const c of cases) {{
+    const div = document.getElementById("plot");
+    let start = performance.now();
+    await Plotly.newPlot(div, c.figure.data, c.figure.layout);
+    await frame();
+    const draw = performance.now() - start;
+    const x = c.figure.data[0].x;
+    start = performance.now();
+    await Plotly.relayout(div, {{"xaxis.range": [x[0], x[Math.floor(x.length / 2)]]}});
+    await frame();
+    const zoom = performance.now() - start;
+    Plotly.purge(div);
+    results.push({{points: c.points, mode: c.mode, draw: draw, zoom: zoom}});
+    document.getElementById("results").insertAdjacentHTML("beforeend",
+      `<tr><td>${{c.points}}</td><td>${{c.mode}}</td><td>${{draw.toFixed(0)}}</td><td>${{zoom.toFixed(0)}}</td></tr>`);
+  }}
+  console.log(JSON.stringify(results));
+}})();
+</script>
+</body>
+</html>
+"""
+
+
+def figures():
+    """
+    (points, mode, figure) of every case, printing the time to build it
+    """
+    print(f"{'points':>9}{'mode':>7}{'build s':>9}{'kB':>8}")
+    for n_points in POINTS:
+        graph_data = graph_frame(
+            N_COLUMNS - 1, n_points // N_COLUMNS // 96 + 1, "quart-horaire"
+        ).iloc[: n_points // N_COLUMNS]
+        for mode in MODES:
+            start = time.perf_counter()
+            fig = make_timeseries(
+                graph_data,
+                get_color_map(graph_data.columns),
+                "quart-horaire",
+                "PM10",
+                "Station",
+                max_points=0,
+                render_mode=mode,
+            )
+            payload = fig.to_json()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{graph_data.size:>9}{mode:>7}{elapsed:>9.2f}{len(payload) / 1e3:>8.0f}"
+            )
+            yield graph_data.size, mode, fig
+
+
+def write_page(output: Path):
+    cases = [
+        f'{{"points": {points}, "mode": "{mode}", "figure": {fig.to_json()}}}'
+        for points, mode, fig in figures()
+    ]
+    output.write_text(
+        PAGE.format(
+            plotlyjs=get_plotlyjs(),
+            threshold=WEBGL_THRESHOLD,
+            cases=f"[{','.join(cases)}]",
+        ),
+        encoding="utf-8",
+    )
+    print(f"open {output} in a browser for the rendering times")
+
+
+def measure_headless(repeat: int) -> list[dict]:
+    """
+    Best of repeat times to render each case to a 1200 x 500 PNG in the
+    headless Chromium of kaleido, after one untimed render
+    """
+    results = []
+    for points, mode, fig in figures():
+        fig.to_image(format="png", width=1200, height=500)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fig.to_image(format="png", width=1200, height=500)
+            timings.append(time.perf_counter() - start)
+        results.append({"points": points, "mode": mode, "render_s": min(timings)})
+    return results
+
+
+def crossover(results: list[dict]):
+    """
+    Smallest point count from which WebGL renders faster than SVG at every
+    larger measured size, None if SVG is faster at the largest one
+    """
+    render = {(row["points"], row["mode"]): row["render_s"] for row in results}
+    threshold = None
+    for points in sorted({row["points"] for row in results}, reverse=True):
+        if render[points, "webgl"] >= render[points, "svg"]:
+            break
+        threshold = points
+    return threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    if not args.headless:
+        write_page(
+            args.output or Path(tempfile.mkdtemp()) / "bench_webgl.html",
+        )
+        return
+
+    import kaleido
+
+    results = measure_headless(args.repeat)
+    print(f"{'points':>9}{'svg s':>9}{'webgl s':>9}")
+    for points in sorted({row["points"] for row in results}):
+        svg, webgl = [
+            row["render_s"]
+            for mode in MODES
+            for row in results
+            if row["points"] == points and row["mode"] == mode
+        ]
+        print(f"{points:>9}{svg:>9.3f}{webgl:>9.3f}")
+    threshold = crossover(results)
+    if threshold is None:
+        print(f"SVG is faster up to {max(POINTS)} points, WebGL never pays off")
+    else:
+        print(f"WebGL is faster from {threshold} points")
+    print(f"threshold in use: {WEBGL_THRESHOLD} points")
+
+    output = args.output or RESULTS_DIR / (
+        f"webgl-{dt.datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                **environment(),
+                "renderer": f"kaleido {kaleido.__version__} headless Chromium",
+                "crossover_points": threshold,
+                "results": results,
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
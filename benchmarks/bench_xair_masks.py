@@ -0,0 +1,96 @@
+"""
+Time the vectorized XR masks against the previous row-wise implementation
+(their outputs are compared in tests/test_xair_masks.py)
+
+    python -m benchmarks.bench_xair_masks
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from api_calls.xair import JSON_PATH_LISTS, mask_aorp, mask_duplicates
+from benchmarks.payloads import xr_data_payload
+
+SITE = "13001"
+MEASURE_IDS = [
+    ("24", ["PC13001", "PC13001_2", "PM1013001"]),
+    ("39", ["P213001", "P213001_2", "P2FIDAS"]),
+    ("68", ["PM113001", "pm113001_b", "PM1FIDAS"]),
+    # No PM1 measure named after the site: first measure id is kept
+    ("68", ["PM1FIDAS", "PM1FIDAS_2"]),
+]
+N_DAYS = [1, 30, 180]
+
+
+def legacy_mask_aorp(data):
+    data["value"] = data.apply(
+        lambda row: (
+            np.nan if row["state"] not in ["A", "O", "R", "P"] else row["value"]
+        ),
+        axis=1,
+    )
+    return data[["id", "value", "unit"]]
+
+
+def legacy_mask_duplicates(data, site_name, poll_iso):
+    if poll_iso == "24":
+        data_out = data[data["id"].str.contains(f"PC{site_name[:2]}")]
+    if poll_iso == "39":
+        data_out = data[data["id"].str.contains(f"P2{site_name[:2]}")]
+    if poll_iso == "68":
+        for id in data.id.unique():
+            if f"PM1{site_name[:2]}".lower() in str(id).lower():
+                data_out = data[data["id"].str.contains(f"PM1{site_name[:2]}")]
+                break
+            else:
+                data_out = data[data["id"] == data["id"].unique()[0]]
+    return data_out
+
+
+def xr_frame(measure_ids: list[str], n_days: int) -> pd.DataFrame:
+    data = pd.json_normalize(
+        data=xr_data_payload(measure_ids, n_days=n_days),
+        record_path=JSON_PATH_LISTS["data_base"]["record_path"],
+        meta=JSON_PATH_LISTS["data_base"]["meta"],
+    ).rename(columns={"sta.unit.id": "unit"})
+    data["date"] = pd.to_datetime(data["date"], format="%Y-%m-%dT%H:%M:%SZ")
+    return data.set_index("date")
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'case':<26}{'rows':>9}{'legacy (s)':>12}{'new (s)':>10}{'speedup':>9}")
+    for poll_iso, measure_ids in MEASURE_IDS:
+        for n_days in N_DAYS:
+            data = xr_frame(measure_ids, n_days)
+            for as_category in [False, True]:
+                frame = data.copy()
+                if as_category:
+                    frame[["id", "state"]] = frame[["id", "state"]].astype("category")
+
+                _, legacy_time = timed(
+                    lambda d: legacy_mask_duplicates(
+                        legacy_mask_aorp(d), SITE, poll_iso
+                    ),
+                    frame.copy(),
+                )
+                _, new_time = timed(
+                    lambda d: mask_duplicates(mask_aorp(d), SITE, poll_iso),
+                    frame.copy(),
+                )
+                case = f"{poll_iso} {n_days} d{' category' if as_category else ''}"
+                print(
+                    f"{case:<26}{len(frame):>9}{legacy_time:>12.3f}{new_time:>10.4f}"
+                    f"{legacy_time / new_time:>8.0f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
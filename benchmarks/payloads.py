@@ -0,0 +1,213 @@
+"""
+Synthetic upstream payloads for the benchmarks
+"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+STEPS = {"quart-horaire": dt.timedelta(minutes=15), "horaire": dt.timedelta(hours=1)}
+
+
+def timestamps(
+    start: str,
+    n_days: int,
+    aggregation: str,
+    fmt: str = "%Y-%m-%dT%H:%M:%S+00:00",
+) -> list[str]:
+    step = STEPS[aggregation]
+    start_time = dt.datetime.fromisoformat(start)
+    n_steps = int(dt.timedelta(days=n_days) / step)
+    return [(start_time + i * step).strftime(fmt) for i in range(n_steps)]
+
+
+def microspot_payload(
+    n_devices: int = 1,
+    n_days: int = 1,
+    aggregation: str = "horaire",
+    iso_codes: list[str] = ["24"],
+    n_campaigns: int = 1,
+    start: str = "2024-01-01T00:00:00",
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Microspot export JSON: devices -> datastreams (one per campaign and
+    pollutant) -> observations, the date range being split between campaigns
+    """
+    rng = np.random.default_rng(seed)
+    dates = timestamps(start, n_days, aggregation)
+    campaign_dates = [
+        chunk.tolist() for chunk in np.array_split(np.array(dates), n_campaigns)
+    ]
+
+    devices = []
+    for i_device in range(n_devices):
+        device_id = 1000 + i_device
+        datastreams = []
+        for i_campaign, dates_chunk in enumerate(campaign_dates):
+            location = {
+                "id": 10 * device_id + i_campaign,
+                "name": f"Site {device_id}-{i_campaign}",
+                "position": [43.0 + rng.random(), 5.0 + rng.random()],
+            }
+            for iso_code in iso_codes:
+                raw = rng.gamma(2.0, 8.0, size=len(dates_chunk)).round(1)
+                datastreams.append(
+                    {
+                        "id": 100 * device_id + i_campaign,
+                        "campaign": {"name": f"Campagne {i_campaign}"},
+                        "location": location,
+                        "observations": [
+                            {
+                                "happenedAt": date,
+                                "isoCode": iso_code,
+                                "valueRaw": float(value),
+                                "valueModified": float(value * 0.9),
+                                "unit": "µg/m3",
+                            }
+                            for date, value in zip(dates_chunk, raw)
+                        ],
+                    }
+                )
+        devices.append(
+            {
+                "id": device_id,
+                "uid": f"UID{device_id}",
+                "scanInterval": 60,
+                "datastreams": datastreams,
+            }
+        )
+    return devices
+
+
+def xr_data_payload(
+    measure_ids: list[str],
+    n_days: int = 1,
+    aggregation: str = "quart-horaire",
+    states: str = "AAAAAAAOORPNIM",
+    start: str = "2024-01-01T00:00:00",
+    seed: int = 0,
+) -> list[dict]:
+    """
+    XR dms-api `data` JSON: one entry per measure id, with values and
+    validation states under `sta` (base) or `hourly`
+    """
+    rng = np.random.default_rng(seed)
+    dates = timestamps(start, n_days, aggregation, fmt="%Y-%m-%dT%H:%M:%SZ")
+    key = "sta" if aggregation == "quart-horaire" else "hourly"
+    payload = []
+    for measure_id in measure_ids:
+        values = rng.gamma(2.0, 8.0, size=len(dates)).round(1)
+        measure_states = rng.choice(list(states), size=len(dates))
+        payload.append(
+            {
+                "id": measure_id,
+                key: {
+                    "unit": {"id": "µg/m3"},
+                    "data": [
+                        {"date": date, "value": float(value), "state": str(state)}
+                        for date, value, state in zip(dates, values, measure_states)
+                    ],
+                },
+            }
+        )
+    return payload
+
+
+def graph_frame(
+    n_sensors: int = 10,
+    n_days: int = 30,
+    aggregation: str = "quart-horaire",
+    station: bool = True,
+    nan_fraction: float = 0.02,
+    start: str = "2024-01-01T00:00:00",
+    seed: int = 0,
+):
+    """
+    build_graph_data-like frame: a "station" column and microcapteur_<id>
+    columns sharing a correlated signal, with missing values
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(
+        start,
+        periods=int(dt.timedelta(days=n_days) / STEPS[aggregation]),
+        freq=STEPS[aggregation],
+        name="date",
+    )
+    columns = (["station"] if station else []) + [
+        f"microcapteur_{1000 + i}" for i in range(n_sensors)
+    ]
+    signal = rng.gamma(2.0, 8.0, size=(len(index), 1))
+    values = signal * rng.uniform(0.7, 1.3, size=len(columns)) + rng.normal(
+        0, 3, size=(len(index), len(columns))
+    )
+    values[rng.random(values.shape) < nan_fraction] = np.nan
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+# XR measure id prefixes and physical tags of the pollutants, see
+# xair.MEASURE_ID_PREFIXES
+XR_PHYSICALS = {"24": ("PC", "PM10"), "39": ("P2", "PM2.5"), "68": ("PM1", "PM1")}
+
+
+def xr_measure_ids(site_id: str, iso_code: str, n_duplicates: int = 1) -> list[str]:
+    """
+    Measure ids of a station for a pollutant: the site measure (and
+    n_duplicates - 1 duplicates of it) and a measure not named after the
+    site
+    """
+    prefix, _ = XR_PHYSICALS[iso_code]
+    ids = [f"{prefix}{site_id}"] + [
+        f"{prefix}{site_id}_{i}" for i in range(2, n_duplicates + 1)
+    ]
+    return ids + [f"{prefix}FIDAS"]
+
+
+def xr_measures_payload(
+    site_ids: list[str],
+    iso_codes: list[str] = ["24"],
+    n_duplicates: int = 1,
+) -> list[dict]:
+    """
+    XR dms-api `measures` JSON: the xr_measure_ids of every site and
+    pollutant
+    """
+    return [
+        {
+            "id": measure_id,
+            "site": {"id": site_id},
+            "physical": {"id": iso_code, "tagPhy": XR_PHYSICALS[iso_code][1]},
+            "unit": {"id": "µg/m3"},
+        }
+        for site_id in site_ids
+        for iso_code in iso_codes
+        for measure_id in xr_measure_ids(site_id, iso_code, n_duplicates)
+    ]
+
+
+def xr_sites_payload(site_ids: list[str], seed: int = 0) -> list[dict]:
+    """
+    XR dms-api `sites` JSON
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "id": site_id,
+            "labelSite": f"Station {site_id}",
+            "startDate": "2000-01-01T00:00:00Z",
+            "stopDate": None,
+            "address": {
+                "department": {"id": site_id[:2], "labelDepartment": "Dept"},
+                "commune": {"labelCommune": f"Commune {site_id}"},
+                "latitude": 43.0 + rng.random(),
+                "longitude": 5.0 + rng.random(),
+            },
+            "environment": {
+                "locationTypeLabel": "Urbaine",
+                "classTypeLabel": "Fond",
+            },
+            "sectors": {"zoneOfActivityLabel": "Zone"},
+        }
+        for site_id in site_ids
+    ]
@@ -0,0 +1,318 @@
+"""
+Benchmark suite: every stage of a dashboard query, from the upstream JSON
+to the figures, on synthetic payloads from 1 device over 1 day up to 500
+devices over a year
+
+The upstream APIs are replaced by the payloads.py generators (the HTTP
+client is patched and the time series cache disabled), so the timings
+cover parsing, masking, assembly and figure building only. Results are
+written as JSON to benchmarks/results/, and printed against an earlier
+results file with --baseline.
+
+    python -m benchmarks.suite [--scales tiny,small] [--repeat 3]
+        [--output results.json] [--baseline results/suite-....json]
+
+The "large" and "xl" scales are not run by default: their Microspot JSON
+alone takes several (large) to tens of (xl) GB of memory.
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import plotly
+
+from api_calls import xair
+from api_calls.http_client import http_client
+from api_calls.microspot_api import DATA_AGG_DIC, response_to_dataframe
+from api_calls.ts_cache import ts_cache
+from benchmarks.payloads import (
+    microspot_payload,
+    xr_data_payload,
+    xr_measure_ids,
+    xr_measures_payload,
+    xr_sites_payload,
+)
+from src.layout.content_utils.build_graph_data import build_graph_data
+from src.layout.content_utils.make_24h_avg import make_24h_avg
+from src.layout.content_utils.make_boxplot import make_boxplot
+from src.layout.content_utils.make_corr_matrix import make_corr_matrix
+from src.layout.content_utils.make_diurnal_cycle import make_diurnal_cycle
+from src.layout.content_utils.make_map import make_map
+from src.layout.content_utils.make_summary_table import make_summary_table
+from src.layout.content_utils.make_timeseries import make_timeseries
+from src.utils.fonctions import get_color_map, weekday_profiles
+from src.utils.stats import column_stats
+
+SCALES = {
+    # name: (n_devices, n_days)
+    "tiny": (1, 1),
+    "small": (10, 7),
+    "medium": (50, 30),
+    "large": (100, 180),
+    "xl": (500, 365),
+}
+DEFAULT_SCALES = ["tiny", "small", "medium"]
+RESULTS_DIR = Path(__file__).parent / "results"
+
+START = "2024-01-01"
+POLLUANT = "PM10"
+STATION = "13001"
+N_CAMPAIGNS = 2
+
+
+class Response:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class FakeUpstream:
+    """
+    Microspot and XR APIs answering with payloads.py JSON for whatever
+    date range and measures are requested. Payloads are generated on the
+    first request and kept, so only the first query pays for them.
+    """
+
+    def __init__(self, n_devices: int):
+        self.n_devices = n_devices
+        self.payloads = {}
+
+    def payload(self, key: tuple, generate):
+        if key not in self.payloads:
+            self.payloads[key] = generate()
+        return self.payloads[key]
+
+    def post(self, url: str, json: dict = None, **kwargs) -> Response:
+        aggregation = {label: agg for agg, label in DATA_AGG_DIC.items()}[
+            json["aggregation"]
+        ]
+        start, end = [
+            pd.Timestamp(date).tz_localize(None) for date in json["dateRange"]
+        ]
+        return Response(
+            self.payload(
+                (
+                    "microspot",
+                    aggregation,
+                    start,
+                    end,
+                    tuple(json["observationTypeCodes"]),
+                ),
+                lambda: microspot_payload(
+                    n_devices=self.n_devices,
+                    n_days=(end - start) / pd.Timedelta(days=1),
+                    aggregation=aggregation,
+                    iso_codes=json["observationTypeCodes"],
+                    n_campaigns=N_CAMPAIGNS,
+                    start=start.isoformat(),
+                ),
+            )
+        )
+
+    def get(self, url: str, **kwargs) -> Response:
+        params = {
+            key: values[0] for key, values in parse_qs(urlsplit(url).query).items()
+        }
+        if url.startswith(xair.URL_DICT["measures"]):
+            return Response(
+                {"measures": xr_measures_payload([STATION], list(xair.ISO.values()))}
+            )
+        if url.startswith(xair.URL_DICT["sites"]):
+            return Response({"sites": xr_sites_payload([STATION])})
+
+        start = pd.Timestamp(params["from"]).tz_localize(None)
+        end = pd.Timestamp(params["to"]).tz_localize(None)
+        aggregation = "quart-horaire" if params["dataTypes"] == "base" else "horaire"
+        return Response(
+            {
+                "data": self.payload(
+                    ("xr", aggregation, start, end, params["measures"]),
+                    lambda: xr_data_payload(
+                        params["measures"].split(","),
+                        n_days=(end - start) / pd.Timedelta(days=1),
+                        aggregation=aggregation,
+                        start=start.isoformat(),
+                    ),
+                )
+            }
+        )
+
+
+def timed(func, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {"best_s": min(timings), "mean_s": float(np.mean(timings))}
+
+
+def run_scale(name: str, repeat: int) -> list[dict]:
+    n_devices, n_days = SCALES[name]
+    end_date = (dt.date.fromisoformat(START) + dt.timedelta(days=n_days)).isoformat()
+    sensors = [f"Site {1000 + i} - {1000 + i}" for i in range(n_devices)]
+    upstream = FakeUpstream(n_devices)
+
+    microspot_json = microspot_payload(
+        n_devices=n_devices,
+        n_days=n_days,
+        aggregation="quart-horaire",
+        iso_codes=[xair.ISO[POLLUANT]],
+        n_campaigns=N_CAMPAIGNS,
+        start=f"{START}T00:00:00",
+    )
+    measures = ",".join(xr_measure_ids(STATION, xair.ISO[POLLUANT]))
+    xr_args = dict(
+        fromtime=f"{START}T00:00:00Z",
+        totime=f"{end_date}T00:00:00Z",
+        folder="data",
+        datatype="base",
+        measures=measures,
+    )
+
+    with (
+        patch.object(http_client, "get", upstream.get),
+        patch.object(http_client, "post", upstream.post),
+        patch.object(ts_cache, "cache_dir", ""),
+        contextlib.redirect_stdout(io.StringIO()),
+    ):
+        xr_raw = xair.request_xr(**xr_args)
+        xr_data = xr_raw.assign(
+            date=pd.to_datetime(xr_raw["date"], format="%Y-%m-%dT%H:%M:%SZ")
+        ).set_index("date")
+        xr_masked = xair.mask_aorp(xr_data)
+
+        def query():
+            return build_graph_data(START, end_date, sensors, POLLUANT, STATION)
+
+        # Generates the upstream payloads, untimed
+        quart_data, _, gdf = query()
+
+        graph_data = quart_data
+        color_map = get_color_map(graph_data.columns)
+        stats = column_stats(graph_data)
+        profiles = weekday_profiles(graph_data)
+        figure_args = (graph_data, color_map, "quart-horaire", POLLUANT, STATION, True)
+
+        cases = {
+            "response_to_dataframe": lambda: response_to_dataframe(microspot_json),
+            "request_xr": lambda: xair.request_xr(**xr_args),
+            "mask_aorp": lambda: xair.mask_aorp(xr_data),
+            "mask_duplicates": lambda: xair.mask_duplicates(
+                xr_masked, STATION, xair.ISO[POLLUANT]
+            ),
+            "build_graph_data": query,
+            "weekday_profiles": lambda: weekday_profiles(graph_data),
+            "column_stats": lambda: column_stats(graph_data),
+            "make_timeseries": lambda: make_timeseries(*figure_args),
+            "make_diurnal_cycle": lambda: make_diurnal_cycle(
+                graph_data,
+                color_map,
+                POLLUANT,
+                "quart-horaire",
+                "Profil journalier en semaine",
+                station_name=STATION,
+                show_thresholds=True,
+                profiles=profiles,
+            ),
+            "make_boxplot": lambda: make_boxplot(*figure_args, stats=stats),
+            "make_24h_avg": lambda: make_24h_avg(*figure_args),
+            "make_corr_matrix": lambda: make_corr_matrix(graph_data, STATION, stats),
+            "make_summary_table": lambda: make_summary_table(
+                graph_data, STATION, stats
+            ),
+            "make_map": lambda: make_map(gdf, color_map, STATION),
+        }
+        results = []
+        for case, func in cases.items():
+            results.append(
+                {
+                    "scale": name,
+                    "n_devices": n_devices,
+                    "n_days": n_days,
+                    "rows": len(graph_data.index),
+                    "columns": len(graph_data.columns),
+                    "case": case,
+                    **timed(func, repeat),
+                }
+            )
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plotly": plotly.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", default=",".join(DEFAULT_SCALES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        baseline = {
+            (row["scale"], row["case"]): row["best_s"]
+            for row in json.loads(args.baseline.read_text())["results"]
+        }
+
+    results = []
+    print(f"{'scale':<8}{'case':<24}{'rows x cols':>14}{'best s':>10}{'mean s':>10}")
+    for name in args.scales.split(","):
+        for row in run_scale(name, args.repeat):
+            results.append(row)
+            line = (
+                f"{row['scale']:<8}{row['case']:<24}"
+                f"{row['rows']:>9} x {row['columns']:<3}"
+                f"{row['best_s']:>10.4f}{row['mean_s']:>10.4f}"
+            )
+            previous = baseline.get((row["scale"], row["case"]))
+            if previous:
+                line += f"{previous / row['best_s']:>8.2f}x"
+            print(line)
+
+    output = args.output or RESULTS_DIR / (
+        f"suite-{dt.datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps({**environment(), "results": results}, indent=2),
+        encoding="utf-8",
+    )
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
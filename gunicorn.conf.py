@@ -0,0 +1,13 @@
+"""
+gunicorn settings of the dashboard
+
+    gunicorn app:server
+"""
+
+
+def post_worker_init(worker):
+    # Warm the caches from server start rather than on the first request.
+    # Every worker starts the warmer, one of them runs it (CacheWarmer.lead).
+    from app import start_background_tasks
+
+    start_background_tasks()
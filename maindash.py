@@ -1,5 +1,16 @@
-from dash import Dash
+import os
+
+import diskcache
+from dash import Dash, DiskcacheManager
 import dash_bootstrap_components as dbc
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Background callbacks run as local processes, their state lives on disk
+JOBS_DIR = os.getenv("MICAEXP_JOBS_DIR", "data/cache/jobs")
+
+background_callback_manager = DiskcacheManager(diskcache.Cache(JOBS_DIR))
 
 app = Dash(
     __name__,
@@ -8,4 +19,5 @@ app = Dash(
     meta_tags=[
         {"name": "viewport", "content": "width=device-width, initial-scale=1.0"}
     ],
+    background_callback_manager=background_callback_manager,
 )
@@ -1,12 +1,26 @@
 from dotenv import load_dotenv
-from dash import html, dcc, Input, Output, dash_table, ctx, no_update
+from dash import html, dcc, Input, Output, State, Patch, dash_table, no_update
 from datetime import datetime, timedelta
 import dash_bootstrap_components as dbc
 import numpy as np
 import pandas as pd
-from src.utils.fonctions import get_color_map
+from src.utils.downsample import pyramid_window
+from src.utils.fonctions import (
+    get_color_map,
+    relayout_x_range,
+    threshold_shapes,
+    weekday_profiles,
+)
 from src.utils.glob_vars import COLORS
-from src.layout.content_utils.build_graph_data import build_graph_data
+from src.utils.query_store import (
+    get_graph_data,
+    get_pyramid,
+    is_cached,
+    normalize_query,
+    query_key,
+    render_store,
+)
+from src.utils.stats import column_stats
 from src.layout.content_utils.make_24h_avg import make_24h_avg
 from src.layout.content_utils.make_boxplot import make_boxplot
 from src.layout.content_utils.make_corr_matrix import make_corr_matrix
@@ -14,7 +28,9 @@ from src.layout.content_utils.make_diurnal_cycle import make_diurnal_cycle
 from src.layout.content_utils.make_map import make_map
 from src.layout.content_utils.make_summary_table import make_summary_table
 from src.layout.content_utils.make_timeseries import make_timeseries
+from src.layout.content_utils.build_graph_data import fetch_label
 from src.layout.styles import CONTENT_STYLE
+from src.utils.export import EXPORT_FORMATS, METADATA_ROUTE, export_url
 from maindash import app
 
 load_dotenv()
@@ -23,9 +39,34 @@ load_dotenv()
 def get_content():
     return html.Div(
         [
+            # Shown while the data of the query is fetched in the background
+            html.Div(
+                [
+                    html.Progress(id="fetch_progress", value="0", max="1"),
+                    html.Span(id="fetch_progress_label", style={"margin": "0 10px"}),
+                    html.Button("Annuler", id="cancel_fetch_btn", n_clicks=0),
+                ],
+                id="fetch_progress_div",
+                style={"display": "none"},
+            ),
             dcc.Loading(
                 id="loading",
                 children=[
+                    dcc.Store(id="graph_query"),
+                    # Queries not in the query store, fetched by fetch_data
+                    dcc.Store(id="fetch_request"),
+                    # What each tab currently shows, see render_tab
+                    *[
+                        dcc.Store(id=f"rendered_{tab}")
+                        for tab in [
+                            "timeseries",
+                            "diurnal",
+                            "boxplot",
+                            "avg24h",
+                            "correlation",
+                            "map",
+                        ]
+                    ],
                     html.H1(id="title_layout"),
                     html.Br(),
                     dash_table.DataTable(
@@ -37,9 +78,12 @@ def get_content():
                     ),
                     html.Br(),
                     dcc.Tabs(
-                        [
+                        id="graph_tabs",
+                        value="timeseries",
+                        children=[
                             dcc.Tab(
                                 label="Séries temporelles",
+                                value="timeseries",
                                 children=[
                                     html.Div(
                                         [
@@ -51,6 +95,7 @@ def get_content():
                             ),
                             dcc.Tab(
                                 label="Profils journaliers",
+                                value="diurnal",
                                 children=[
                                     html.Div(
                                         [
@@ -77,6 +122,7 @@ def get_content():
                             ),
                             dcc.Tab(
                                 label="Boxplot",
+                                value="boxplot",
                                 children=[
                                     html.Div(
                                         [
@@ -88,6 +134,7 @@ def get_content():
                             ),
                             dcc.Tab(
                                 label="Moyenne glissante 24h",
+                                value="avg24h",
                                 children=[
                                     html.Div(
                                         [
@@ -99,6 +146,7 @@ def get_content():
                             ),
                             dcc.Tab(
                                 label="Corrélation",
+                                value="correlation",
                                 children=[
                                     html.Div(
                                         [
@@ -110,6 +158,7 @@ def get_content():
                             ),
                             dcc.Tab(
                                 label="Carte",
+                                value="map",
                                 children=[
                                     html.Div(
                                         [
@@ -119,13 +168,44 @@ def get_content():
                                     )
                                 ],
                             ),
-                        ]
+                        ],
                     ),
                     html.Br(),
-                    html.Button(
-                        "Télécharger les données", id="download_btn", n_clicks=0
+                    # Served by the streaming export route, see src/utils/export.py
+                    html.A(
+                        html.Button("Télécharger les données"),
+                        id="download_link",
+                        href="",
+                    ),
+                    dcc.Dropdown(
+                        options=[
+                            {"label": label, "value": value}
+                            for value, label in EXPORT_FORMATS.items()
+                        ],
+                        value="csv",
+                        id="download_format_dropdown",
+                        clearable=False,
+                        style={
+                            "display": "inline-block",
+                            "width": "220px",
+                            "margin-left": "10px",
+                            "vertical-align": "middle",
+                        },
+                    ),
+                    dcc.Checklist(
+                        options=[{"label": " Compresser (gzip)", "value": "gzip"}],
+                        value=[],
+                        id="download_compression_checkbox",
+                        inline=True,
+                        style={"display": "inline-block", "margin-left": "10px"},
+                    ),
+                    html.A(
+                        "Métadonnées (JSON)",
+                        id="metadata_link",
+                        href="",
+                        target="_blank",
+                        style={"margin-left": "10px"},
                     ),
-                    dcc.Download(id="download_data"),
                     html.Hr(),
                     html.Img(
                         src="assets/valeurs_de_reference.png", style={"height": "70%"}
@@ -168,113 +248,429 @@ def build_title(poll: str):
 
 
 @app.callback(
-    Output("timeseries", "figure"),
-    Output("diurnal_cycle_workweek", "figure"),
-    Output("diurnal_cycle_weekend", "figure"),
-    Output("boxplot", "figure"),
-    Output("correlation_matrix", "figure"),
-    Output("summary_table", "columns"),
-    Output("summary_table", "data"),
-    Output("avg24h", "figure"),
-    Output("map", "figure"),
+    Output("graph_query", "data"),
+    Output("fetch_request", "data"),
     Input("my-date-picker-range", "start_date"),
     Input("my-date-picker-range", "end_date"),
     Input("micro_capteur_sites_dropdown", "value"),
     Input("polluant_dropdown", "value"),
     Input("station_xair_dropdown", "value"),
-    Input("time_step_dropdown", "value"),
-    Input("show_thresholds_checkbox", "value"),
+    Input("all_fractions_checkbox", "value"),
 )
-def build_graphs(
+def route_query(
     start_date: np.datetime64,
     end_date: np.datetime64,
     site_plus_capteur: list,
     polluant: str,
     station_name: str = None,
-    aggregation: str = "quart-horaire",
-    show_thresholds: bool = False,
+    all_fractions: list = [],
 ):
-    quart_data, hour_data,gdf = build_graph_data(
+    """
+    Show a query already in the query store right away (e.g. a pollutant
+    switch after fetching all fractions), hand the others to fetch_data
+    """
+    query = normalize_query(
         start_date, end_date, site_plus_capteur, polluant, station_name
     )
+    all_fractions = "all_fractions" in (all_fractions or [])
+    if is_cached(**query, all_fractions=all_fractions):
+        return query, no_update
+    return no_update, {"query": query, "all_fractions": all_fractions}
+
+
+@app.callback(
+    Output("graph_query", "data", allow_duplicate=True),
+    Input("fetch_request", "data"),
+    background=True,
+    progress=[
+        Output("fetch_progress", "value"),
+        Output("fetch_progress", "max"),
+        Output("fetch_progress_label", "children"),
+    ],
+    running=[
+        (
+            Output("fetch_progress_div", "style"),
+            {"display": "block"},
+            {"display": "none"},
+        ),
+    ],
+    # A query shown from the store meanwhile makes the fetch obsolete
+    cancel=[Input("cancel_fetch_btn", "n_clicks"), Input("graph_query", "data")],
+    prevent_initial_call=True,
+)
+def fetch_data(set_progress, request: dict):
+    """
+    Fetch the data of the query into the query store, the rendering
+    callbacks read it back from the query
+
+    Runs as a background job, reporting each upstream request as it
+    completes. A newer query, or the cancel button, terminates the job.
+    With the all fractions box ticked every pollutant is fetched, so the
+    pollutant can then be changed without any request.
+    """
+    query = request["query"]
+
+    def on_progress(name, done, total):
+        set_progress((str(done), str(total), f"{fetch_label(name)} ({done}/{total})"))
+
+    get_graph_data(
+        **query,
+        on_progress=on_progress,
+        all_fractions=request["all_fractions"],
+    )
+    return query
+
+
+def selected_data(query: dict, aggregation: str):
+    quart_data, hour_data, gdf = get_graph_data(**query)
     graph_data = hour_data if aggregation == "horaire" else quart_data
-    color_map = get_color_map(graph_data.columns)
+    return graph_data, gdf
+
 
-    timeseries_fig = make_timeseries(
-        graph_data, color_map, aggregation, polluant, station_name, show_thresholds
+def get_stats(query: dict, aggregation: str) -> dict:
+    """
+    column_stats of the query data, shared by the summary table, the
+    boxplot and the correlation tab
+    """
+    return render_store.get_or_compute(
+        f"{query_key(**query)}:stats:{aggregation}",
+        lambda: column_stats(selected_data(query, aggregation)[0]),
     )
-    week_diurnal_cycle_fig = make_diurnal_cycle(
-        graph_data,
-        color_map,
-        polluant,
+
+
+def render_tab(
+    tab: str,
+    active_tab: str,
+    query: dict,
+    aggregation: str,
+    render_mode: str,
+    show_thresholds: list,
+    rendered: list,
+    build,
+    n_figures: int = 1,
+):
+    """
+    Figures of tab, computed only while it is the active tab
+
+    Figures are memoized per query, aggregation and render mode, and the
+    signature of what the tab currently shows is kept in its rendered_<tab>
+    store: coming back to a tab that is up to date sends nothing, and a
+    threshold change only patches the figures shapes.
+
+    input :
+    -------
+        build : callable
+            (graph_data, gdf, color_map, query, aggregation, render_mode)
+            -> list of n_figures figures, drawn without thresholds
+    return :
+    --------
+        figures and the new signature, as a tuple
+    """
+    if tab != active_tab or not query:
+        return (no_update,) * (n_figures + 1)
+    render_key = f"{query_key(**query)}:{tab}:{aggregation}:{render_mode}"
+    signature = [render_key, bool(show_thresholds)]
+    if rendered == signature:
+        return (no_update,) * (n_figures + 1)
+
+    shapes = threshold_shapes(query["polluant"], show_thresholds)
+    if rendered and rendered[0] == render_key:
+        figures = []
+        for _ in range(n_figures):
+            patch = Patch()
+            patch["layout"]["shapes"] = shapes
+            figures.append(patch)
+        return (*figures, signature)
+
+    def compute():
+        graph_data, gdf = selected_data(query, aggregation)
+        color_map = get_color_map(graph_data.columns)
+        return build(graph_data, gdf, color_map, query, aggregation, render_mode)
+
+    figures = [
+        fig.to_dict() for fig in render_store.get_or_compute(render_key, compute)
+    ]
+    for fig in figures:
+        fig["layout"]["shapes"] = shapes
+    return (*figures, signature)
+
+
+@app.callback(
+    Output("summary_table", "columns"),
+    Output("summary_table", "data"),
+    Input("graph_query", "data"),
+    Input("time_step_dropdown", "value"),
+)
+def build_summary(query: dict, aggregation: str = "quart-horaire"):
+    if not query:
+        return no_update, no_update
+    graph_data, _ = selected_data(query, aggregation)
+    return make_summary_table(
+        graph_data, query["station_name"], stats=get_stats(query, aggregation)
+    )
+
+
+def tab_inputs(tab: str) -> list:
+    return [
+        Input("graph_tabs", "value"),
+        Input("graph_query", "data"),
+        Input("time_step_dropdown", "value"),
+        Input("render_mode_radio", "value"),
+        Input("show_thresholds_checkbox", "value"),
+        State(f"rendered_{tab}", "data"),
+    ]
+
+
+@app.callback(
+    Output("timeseries", "figure"),
+    Output("rendered_timeseries", "data"),
+    *tab_inputs("timeseries"),
+)
+def build_timeseries(active_tab, query, aggregation, render_mode, thresholds, rendered):
+    def build(graph_data, gdf, color_map, query, aggregation, render_mode):
+        return [
+            make_timeseries(
+                graph_data,
+                color_map,
+                aggregation,
+                query["polluant"],
+                query["station_name"],
+                render_mode=render_mode,
+            )
+        ]
+
+    return render_tab(
+        "timeseries",
+        active_tab,
+        query,
         aggregation,
-        "Profil journalier en semaine",
-        week_section="workweek",
-        station_name=station_name,
-        show_thresholds=show_thresholds,
+        render_mode,
+        thresholds,
+        rendered,
+        build,
     )
-    wend_diurnal_cycle_fig = make_diurnal_cycle(
-        graph_data,
-        color_map,
-        polluant,
+
+
+@app.callback(
+    Output("diurnal_cycle_workweek", "figure"),
+    Output("diurnal_cycle_weekend", "figure"),
+    Output("rendered_diurnal", "data"),
+    *tab_inputs("diurnal"),
+)
+def build_diurnal_cycles(
+    active_tab, query, aggregation, render_mode, thresholds, rendered
+):
+    def build(graph_data, gdf, color_map, query, aggregation, render_mode):
+        profiles = weekday_profiles(graph_data)
+        return [
+            make_diurnal_cycle(
+                graph_data,
+                color_map,
+                query["polluant"],
+                aggregation,
+                title,
+                week_section=week_section,
+                station_name=query["station_name"],
+                profiles=profiles,
+                render_mode=render_mode,
+            )
+            for week_section, title in [
+                ("workweek", "Profil journalier en semaine"),
+                ("weekend", "Profil journalier en week-end"),
+            ]
+        ]
+
+    return render_tab(
+        "diurnal",
+        active_tab,
+        query,
         aggregation,
-        "Profil journalier en week-end",
-        week_section="weekend",
-        station_name=station_name,
-        show_thresholds=show_thresholds,
+        render_mode,
+        thresholds,
+        rendered,
+        build,
+        n_figures=2,
     )
-    fig_boxplot = make_boxplot(
-        graph_data, color_map, aggregation, polluant, station_name, show_thresholds
+
+
+@app.callback(
+    Output("boxplot", "figure"),
+    Output("rendered_boxplot", "data"),
+    *tab_inputs("boxplot"),
+)
+def build_boxplot(active_tab, query, aggregation, render_mode, thresholds, rendered):
+    def build(graph_data, gdf, color_map, query, aggregation, render_mode):
+        return [
+            make_boxplot(
+                graph_data,
+                color_map,
+                aggregation,
+                query["polluant"],
+                query["station_name"],
+                stats=get_stats(query, aggregation),
+            )
+        ]
+
+    # Boxes and outlier markers are drawn the same in every render mode
+    return render_tab(
+        "boxplot",
+        active_tab,
+        query,
+        aggregation,
+        "",
+        thresholds,
+        rendered,
+        build,
     )
-    fig_corr = make_corr_matrix(graph_data, station_name)
-    columns, data = make_summary_table(graph_data, station_name)
-    fig_24h_avg = make_24h_avg(
-        graph_data, color_map, aggregation, polluant, station_name, show_thresholds
+
+
+@app.callback(
+    Output("avg24h", "figure"),
+    Output("rendered_avg24h", "data"),
+    *tab_inputs("avg24h"),
+)
+def build_24h_avg(active_tab, query, aggregation, render_mode, thresholds, rendered):
+    def build(graph_data, gdf, color_map, query, aggregation, render_mode):
+        return [
+            make_24h_avg(
+                graph_data,
+                color_map,
+                aggregation,
+                query["polluant"],
+                query["station_name"],
+                render_mode=render_mode,
+            )
+        ]
+
+    return render_tab(
+        "avg24h",
+        active_tab,
+        query,
+        aggregation,
+        render_mode,
+        thresholds,
+        rendered,
+        build,
     )
-    fig_map = make_map(
-        graph_data, color_map, polluant, start_date, end_date, station_name
+
+
+@app.callback(
+    Output("correlation_matrix", "figure"),
+    Output("rendered_correlation", "data"),
+    *tab_inputs("correlation"),
+)
+def build_correlation(
+    active_tab, query, aggregation, render_mode, thresholds, rendered
+):
+    def build(graph_data, gdf, color_map, query, aggregation, render_mode):
+        return [
+            make_corr_matrix(
+                graph_data,
+                query["station_name"],
+                stats=get_stats(query, aggregation),
+            )
+        ]
+
+    # The correlation matrix has no thresholds nor render mode
+    return render_tab(
+        "correlation",
+        active_tab,
+        query,
+        aggregation,
+        "",
+        [],
+        rendered,
+        build,
     )
 
-    return (
-        timeseries_fig,
-        week_diurnal_cycle_fig,
-        wend_diurnal_cycle_fig,
-        fig_boxplot,
-        fig_corr,
-        columns,
-        data,
-        fig_24h_avg,
-        fig_map,
+
+@app.callback(
+    Output("map", "figure"),
+    Output("rendered_map", "data"),
+    *tab_inputs("map"),
+)
+def build_map(active_tab, query, aggregation, render_mode, thresholds, rendered):
+    def build(graph_data, gdf, color_map, query, aggregation, render_mode):
+        return [make_map(gdf, color_map, query["station_name"])]
+
+    # The map depends on the sensors only
+    return render_tab(
+        "map",
+        active_tab,
+        query,
+        "",
+        "",
+        [],
+        rendered,
+        build,
     )
 
 
 @app.callback(
-    Output("download_data", "data"),
-    Input("download_btn", "n_clicks"),
-    Input("my-date-picker-range", "start_date"),
-    Input("my-date-picker-range", "end_date"),
-    Input("micro_capteur_sites_dropdown", "value"),
-    Input("polluant_dropdown", "value"),
-    Input("station_xair_dropdown", "value"),
-    Input("time_step_dropdown", "value"),
+    Output("timeseries", "figure", allow_duplicate=True),
+    Input("timeseries", "relayoutData"),
+    State("graph_query", "data"),
+    State("time_step_dropdown", "value"),
+    State("show_thresholds_checkbox", "value"),
+    State("render_mode_radio", "value"),
     prevent_initial_call=True,
 )
-def download_data(
-    n_clicks,
-    start_date,
-    end_date,
-    site_plus_capteur,
-    polluant,
-    station_name,
-    aggregation,
+def zoom_timeseries(
+    relayout_data,
+    query,
+    aggregation="quart-horaire",
+    show_thresholds=False,
+    render_mode="auto",
 ):
-    if ctx.triggered_id != "download_btn":
+    """
+    Redraw the time series for the zoomed window from the finest level of
+    the query pyramid that fits the points budget, and back to the whole
+    period on autoscale
+    """
+    x_range = relayout_x_range(relayout_data)
+    if x_range is None and not (relayout_data or {}).get("xaxis.autorange"):
         return no_update
-    quart_data, hour_data,gdf = build_graph_data(
-        start_date, end_date, site_plus_capteur, polluant, station_name
+    if not query:
+        return no_update
+
+    pyramid = get_pyramid(**query, aggregation=aggregation)
+    graph_data = pyramid[aggregation]
+    level = aggregation
+    if x_range is not None:
+        level, graph_data = pyramid_window(pyramid, *x_range)
+        if len(graph_data.index) < 2:
+            return no_update
+    return make_timeseries(
+        graph_data,
+        get_color_map(pyramid[aggregation].columns),
+        level,
+        query["polluant"],
+        query["station_name"],
+        show_thresholds,
+        x_range=x_range,
+        render_mode=render_mode,
+    )
+
+
+@app.callback(
+    Output("download_link", "href"),
+    Output("metadata_link", "href"),
+    Output("download_compression_checkbox", "style"),
+    Input("graph_query", "data"),
+    Input("time_step_dropdown", "value"),
+    Input("download_format_dropdown", "value"),
+    Input("download_compression_checkbox", "value"),
+)
+def download_link(query, aggregation, export_format, compression):
+    # gzip only applies to CSV, the columnar formats are zstd compressed
+    compression_style = {
+        "display": "inline-block" if export_format == "csv" else "none",
+        "margin-left": "10px",
+    }
+    if not query:
+        return no_update, no_update, compression_style
+    return (
+        export_url(query, aggregation, "gzip" if compression else None, export_format),
+        export_url(query, aggregation, route=METADATA_ROUTE),
+        compression_style,
     )
-    graph_data = hour_data if aggregation == "horaire" else quart_data
-    # Convert to CSV
-    csv_string = graph_data.to_csv(index=True, sep=";")
-    return dict(content=csv_string, filename="donnees.csv")
-    
\ No newline at end of file
@@ -1,9 +1,109 @@
 import numpy as np
 import pandas as pd
-import geopandas as gp
+from functools import partial
 
-from api_calls.xair import wrap_xair_request, ISO, request_xr
-from api_calls.microspot_api import request_microspot
+from api_calls.xair import wrap_xair_request, ISO, xr_catalog
+from api_calls.microspot_api import request_microspot, widen_float32
+from api_calls.fan_out import fetch_all
+
+# Progress labels of the build_graph_data upstream requests
+FETCH_LABELS = {
+    "capteur_quart": "Microcapteurs quart-horaires",
+    "capteur_hour": "Microcapteurs horaires",
+    "station_quart": "Station quart-horaire",
+    "station_hour": "Station horaire",
+    "station_json": "Informations station",
+}
+
+
+def fetch_label(name: str) -> str:
+    """
+    Progress label of a build_graph_data request name, station requests
+    being suffixed with their pollutant ("station_hour:PM10")
+    """
+    name, _, polluant = name.partition(":")
+    return f"{FETCH_LABELS[name]} {polluant}".strip()
+
+
+def request_microspot_devices(
+    cap_ids: list[int],
+    polluants: list[str],
+    aggregation: str,
+    start_date: str,
+    end_date: str,
+) -> pd.DataFrame:
+    """
+    Fetch all the selected sensors and pollutants in a single Microspot
+    request
+    """
+    if not cap_ids:
+        return pd.DataFrame()
+    return request_microspot(
+        observationTypeCodes=[ISO[polluant] for polluant in polluants],
+        devices=cap_ids,
+        aggregation=aggregation,
+        dateRange=[f"{start_date}T00:00:00+00:00", f"{end_date}T00:00:00+00:00"],
+        metadata=["site_name", "site_lon", "site_lat"],
+    )
+
+
+def split_capteurs(
+    data: pd.DataFrame,
+    cap_ids: list[int],
+    polluant: str,
+    value_col: str,
+) -> list[pd.DataFrame]:
+    """
+    Split a batched Microspot frame into one frame per sensor, in the order of
+    cap_ids, with the value column renamed to microcapteur_<id> and widened
+    back to float64 (see widen_float32)
+    """
+    if not data.empty and "isoCode" in data.columns:
+        data = data[data.isoCode == ISO[polluant]]
+        grouped = dict(tuple(data.groupby("capteur_id", sort=False)))
+    else:
+        grouped = {}
+
+    capteur_dfs = []
+    for cap_id in cap_ids:
+        micro_col_name = f"microcapteur_{cap_id}"
+        capteur_data = grouped.get(cap_id, pd.DataFrame(index=data.index[:0]))
+        capteur_data = capteur_data.rename(columns={value_col: micro_col_name})
+        if micro_col_name not in capteur_data.columns:
+            capteur_data[micro_col_name] = np.nan
+        else:
+            capteur_data[micro_col_name] = widen_float32(capteur_data[micro_col_name])
+        capteur_dfs.append(capteur_data)
+    return capteur_dfs
+
+
+def request_station(
+    station_name: str,
+    polluant: str,
+    datatype: str,
+    start_date: str,
+    end_date: str,
+) -> pd.DataFrame:
+    """
+    XR data of the station for the pollutant, empty when the station does
+    not measure it
+    """
+    if xr_catalog.measures(sites=station_name, physicals=ISO[polluant]).empty:
+        return pd.DataFrame(columns=["value"], index=pd.DatetimeIndex([], name="date"))
+    return wrap_xair_request(
+        fromtime=start_date,
+        totime=end_date,
+        keys="data",
+        sites=station_name,
+        physicals=ISO[polluant],
+        datatype=datatype,
+    )
+
+
+def first_valid(data: pd.DataFrame, col: str, default):
+    if col in data.columns and data[col].notna().any():
+        return data[col].dropna().iloc[0]
+    return default
 
 
 def build_graph_data(
@@ -12,125 +112,152 @@ def build_graph_data(
     site_plus_capteur,
     polluant,
     station_name=None,
+    on_progress=None,
+):
+    """
+    Station and sensors data of the query at both aggregations, and the
+    sites to draw on the map
+
+    on_progress is passed to fetch_all: it is called with (request name,
+    requests done, requests total) as each upstream request completes.
+    """
+    return build_fractions_data(
+        start_date,
+        end_date,
+        site_plus_capteur,
+        [polluant],
+        station_name,
+        on_progress,
+    )[polluant]
+
+
+def build_fractions_data(
+    start_date,
+    end_date,
+    site_plus_capteur,
+    polluants=list(ISO),
+    station_name=None,
+    on_progress=None,
+) -> dict:
+    """
+    build_graph_data of several pollutants at once: the sensors of every
+    pollutant come in one Microspot request per aggregation, the station
+    requests of all pollutants are issued together
+
+    return :
+    --------
+        fractions : dict
+            pollutant -> (quart_data, hour_data, gdf)
+    """
+    capteurs = [capteur.rsplit(" - ", 1) for capteur in site_plus_capteur]
+    cap_ids = [int(cap_id) for _, cap_id in capteurs]
+
+    # Issue every upstream request at once, one request per aggregation for
+    # all selected sensors
+    tasks = {
+        "capteur_quart": partial(
+            request_microspot_devices,
+            cap_ids,
+            polluants,
+            "quart-horaire",
+            start_date,
+            end_date,
+        ),
+        "capteur_hour": partial(
+            request_microspot_devices,
+            cap_ids,
+            polluants,
+            "horaire",
+            start_date,
+            end_date,
+        ),
+    }
+    if station_name:
+        for polluant in polluants:
+            for name, datatype in [
+                ("station_quart", "quart-horaire"),
+                ("station_hour", "horaire"),
+            ]:
+                tasks[f"{name}:{polluant}"] = partial(
+                    request_station,
+                    station_name,
+                    polluant,
+                    datatype,
+                    start_date,
+                    end_date,
+                )
+        tasks["station_json"] = partial(xr_catalog.sites, station_name)
+    fetched = fetch_all(tasks, on_done=on_progress)
+
+    return {
+        polluant: pollutant_graph_data(
+            fetched, polluant, capteurs, cap_ids, start_date, end_date, station_name
+        )
+        for polluant in polluants
+    }
+
+
+def pollutant_graph_data(
+    fetched: dict,
+    polluant: str,
+    capteurs: list,
+    cap_ids: list[int],
+    start_date,
+    end_date,
+    station_name=None,
 ):
+    """
+    build_graph_data result of one pollutant from the build_fractions_data
+    requests
+    """
     # Prepare geo info lists
+    geo_columns = []
     site_names = []
     lons = []
     lats = []
 
     # Fetch station data only if station_name is provided
     if station_name:
-        station_quart_data = wrap_xair_request(
-            fromtime=start_date,
-            totime=end_date,
-            keys="data",
-            sites=station_name,
-            physicals=ISO[polluant],
-            datatype="quart-horaire",
-        )
-        station_hour_data = wrap_xair_request(
-            fromtime=start_date,
-            totime=end_date,
-            keys="data",
-            sites=station_name,
-            physicals=ISO[polluant],
-            datatype="horaire",
-        )
         station_col_name = "station"
-        station_quart_data = station_quart_data.rename(
+        station_quart_data = fetched[f"station_quart:{polluant}"].rename(
             columns={"value": station_col_name}
         )
-        station_hour_data = station_hour_data.rename(
+        station_hour_data = fetched[f"station_hour:{polluant}"].rename(
             columns={"value": station_col_name}
         )
         # Get station geo info
-        station_json = request_xr(folder="sites", sites=station_name)
-        if not station_json.empty:
-            site_names.append(
-                station_json["labelSite"].dropna().iloc[0]
-                if station_json["labelSite"].notna().any()
-                else station_name
-            )
-            lons.append(
-                station_json["longitude"].dropna().iloc[0]
-                if station_json["longitude"].notna().any()
-                else np.nan
-            )
-            lats.append(
-                station_json["latitude"].dropna().iloc[0]
-                if station_json["latitude"].notna().any()
-                else np.nan
-            )
-        else:
-            site_names.append(station_name)
-            lons.append(np.nan)
-            lats.append(np.nan)
+        station_json = fetched["station_json"]
+        geo_columns.append(station_col_name)
+        site_names.append(first_valid(station_json, "labelSite", station_name))
+        lons.append(first_valid(station_json, "longitude", np.nan))
+        lats.append(first_valid(station_json, "latitude", np.nan))
     else:
         station_quart_data = None
         station_hour_data = None
         station_col_name = None
 
-    capteur_quart_dfs = []
-    capteur_hour_dfs = []
-
-    for capteur in site_plus_capteur:
-        cap_name, cap_id = capteur.rsplit(" - ", 1)
-        cap_id = int(cap_id)
-        micro_col_name = f"microcapteur_{cap_id}"
-
-        capteur_quart_data = request_microspot(
-            observationTypeCodes=[ISO[polluant]],
-            devices=[cap_id],
-            aggregation="quart-horaire",
-            dateRange=[f"{start_date}T00:00:00+00:00", f"{end_date}T00:00:00+00:00"],
-        )
-        capteur_quart_data = capteur_quart_data[
-            capteur_quart_data.isoCode == ISO[polluant]
-        ]
-        capteur_quart_data = capteur_quart_data.rename(
-            columns={"valueRaw": micro_col_name}
-        )
-        if micro_col_name not in capteur_quart_data.columns:
-            capteur_quart_data[micro_col_name] = np.nan
-        capteur_quart_dfs.append(capteur_quart_data[[micro_col_name]])
+    capteur_quart_dfs = split_capteurs(
+        fetched["capteur_quart"], cap_ids, polluant, value_col="valueRaw"
+    )
+    capteur_hour_dfs = split_capteurs(
+        fetched["capteur_hour"], cap_ids, polluant, value_col="valueModified"
+    )
 
+    for (cap_name, _), cap_id, capteur_quart_data in zip(
+        capteurs, cap_ids, capteur_quart_dfs
+    ):
+        geo_columns.append(f"microcapteur_{cap_id}")
         # Get geo info from microspot data (first non-NaN value)
-        if not capteur_quart_data.empty:
-            site_names.append(
-                capteur_quart_data["site_name"].dropna().iloc[0]
-                if capteur_quart_data["site_name"].notna().any()
-                else cap_name
-            )
-            lons.append(
-                capteur_quart_data["site_lon"].dropna().iloc[0]
-                if capteur_quart_data["site_lon"].notna().any()
-                else np.nan
-            )
-            lats.append(
-                capteur_quart_data["site_lat"].dropna().iloc[0]
-                if capteur_quart_data["site_lat"].notna().any()
-                else np.nan
-            )
-        else:
-            site_names.append(cap_name)
-            lons.append(np.nan)
-            lats.append(np.nan)
-
-        capteur_hour_data = request_microspot(
-            observationTypeCodes=[ISO[polluant]],
-            devices=[cap_id],
-            aggregation="horaire",
-            dateRange=[f"{start_date}T00:00:00+00:00", f"{end_date}T00:00:00+00:00"],
-        )
-        capteur_hour_data = capteur_hour_data[
-            capteur_hour_data.isoCode == ISO[polluant]
-        ]
-        capteur_hour_data = capteur_hour_data.rename(
-            columns={"valueModified": micro_col_name}
-        )
-        if micro_col_name not in capteur_hour_data.columns:
-            capteur_hour_data[micro_col_name] = np.nan
-        capteur_hour_dfs.append(capteur_hour_data[[micro_col_name]])
+        site_names.append(first_valid(capteur_quart_data, "site_name", cap_name))
+        lons.append(first_valid(capteur_quart_data, "site_lon", np.nan))
+        lats.append(first_valid(capteur_quart_data, "site_lat", np.nan))
+
+    capteur_quart_dfs = [
+        df[[f"microcapteur_{cap_id}"]] for df, cap_id in zip(capteur_quart_dfs, cap_ids)
+    ]
+    capteur_hour_dfs = [
+        df[[f"microcapteur_{cap_id}"]] for df, cap_id in zip(capteur_hour_dfs, cap_ids)
+    ]
 
     if station_name and station_quart_data is not None:
         quart_data = pd.concat(
@@ -152,18 +279,14 @@ def build_graph_data(
         else:
             hour_data = pd.concat(capteur_hour_dfs, axis=1)
 
-    # Build GeoDataFrame
-    df_geo = pd.DataFrame(
+    # Sites of the map: plain lon/lat columns, no geometry needed
+    gdf = pd.DataFrame(
         data={
+            "column": geo_columns,
             "site_name": site_names,
             "lon": lons,
             "lat": lats,
         }
     )
-    gdf = gp.GeoDataFrame(
-        df_geo,
-        geometry=gp.points_from_xy(df_geo.lon, df_geo.lat),
-        crs="EPSG:3857",
-    )
 
     return quart_data, hour_data, gdf
@@ -1,4 +1,6 @@
-from src.utils.glob_vars import SEUILS, UNITS
+from src.utils.glob_vars import UNITS
+from src.utils.downsample import MAX_POINTS, minmax_downsample
+from src.utils.fonctions import line_trace, threshold_shapes
 from plotly import graph_objects as go
 
 
@@ -9,6 +11,8 @@ def make_24h_avg(
     polluant,
     station_name=None,
     show_thresholds=False,
+    max_points=MAX_POINTS,
+    render_mode="auto",
 ):
     fig_24h_avg = go.Figure()
     if graph_data.empty or len(graph_data.index) < 2:
@@ -22,32 +26,25 @@ def make_24h_avg(
 
     window = 24 if aggregation == "horaire" else 96
     rolling_24h = graph_data.rolling(window=window, min_periods=1).mean()
-    for col in rolling_24h.columns:
+    traces = {
+        col: minmax_downsample(rolling_24h[col], max_points)
+        for col in rolling_24h.columns
+    }
+    Trace = line_trace(sum(map(len, traces.values())), render_mode)
+    for col, col_data in traces.items():
         fig_24h_avg.add_trace(
-            go.Scatter(
-                y=rolling_24h[col],
-                x=rolling_24h.index,
+            Trace(
+                y=col_data.values,
+                x=col_data.index,
                 mode="lines",
                 line=dict(color=color_map.get(col, None), dash="solid"),
                 name=station_name if station_name and col == "station" else col,
             )
         )
-    # Add thresholds if requested
-    if show_thresholds and polluant in ["PM10", "PM2.5"]:
-        for seuil in SEUILS[polluant]["FR"]:
-            seuil_value = SEUILS[polluant]["FR"][seuil]
-            fig_24h_avg.add_trace(
-                go.Scatter(
-                    y=[seuil_value] * len(rolling_24h.index),
-                    x=rolling_24h.index,
-                    name=seuil,
-                    line=dict(color="black", dash="dash"),
-                    showlegend=False,
-                )
-            )
     fig_24h_avg.update_layout(
         title="Moyenne glissante 24h",
         title_x=0.5,
+        shapes=threshold_shapes(polluant, show_thresholds),
         xaxis=dict(
             showgrid=True,
             gridcolor="#cccccc",
@@ -1,5 +1,6 @@
-from src.utils.fonctions import graph_title
-from src.utils.glob_vars import SEUILS, UNITS
+from src.utils.fonctions import graph_title, threshold_shapes
+from src.utils.glob_vars import UNITS
+from src.utils.stats import column_stats
 
 from plotly import graph_objects as go
 
@@ -11,6 +12,7 @@ def make_boxplot(
     polluant,
     station_name=None,
     show_thresholds=False,
+    stats=None,
 ):
     # Handle empty data gracefully
     if graph_data.empty or len(graph_data.index) < 1:
@@ -24,38 +26,48 @@ def make_boxplot(
         return fig
 
     fig_boxplot = go.Figure()
-    fig_boxplot.layout.xaxis2 = go.layout.XAxis(
-        overlaying="x", range=[0, 1], showticklabels=False
-    )
-    for col in graph_data.columns:
+    # Quartiles, fences and outliers are precomputed: no raw samples are sent
+    if stats is None:
+        stats = column_stats(graph_data)
+    for col, col_stats in stats["summary"].iterrows():
+        name = station_name if col == "station" else col
         fig_boxplot.add_trace(
             go.Box(
-                y=graph_data[col],
-                name=station_name if col == "station" else col,
+                x=[name],
+                q1=[col_stats["q1"]],
+                median=[col_stats["median"]],
+                q3=[col_stats["q3"]],
+                lowerfence=[col_stats["lowerfence"]],
+                upperfence=[col_stats["upperfence"]],
+                name=name,
+                legendgroup=name,
+                hoverinfo="x+y",
                 line=dict(color=color_map[col]),
             )
         )
-    # Add thresholds if requested
-    if show_thresholds and polluant in ["PM10", "PM2.5"]:
-        for i, seuil in enumerate(list(SEUILS[polluant]["FR"].keys())):
-            seuil_value = SEUILS[polluant]["FR"][seuil]
-            fig_boxplot.add_scatter(
-                x=[0, 1],
-                y=[seuil_value, seuil_value],
-                mode="lines",
-                xaxis="x2",
+        # Outliers belong to the box above: same legend group and hover,
+        # no legend entry of their own
+        fig_boxplot.add_trace(
+            go.Scatter(
+                x=[name] * len(stats["outliers"][col]),
+                y=stats["outliers"][col],
+                mode="markers",
+                marker=dict(color=color_map[col], size=4),
+                name=name,
+                legendgroup=name,
                 showlegend=False,
-                line=dict(dash="dash", color="black", width=2),
+                hoverinfo="x+y",
             )
+        )
     fig_boxplot.update_layout(
         title=graph_title("boxplot", aggregation, polluant),
         title_x=0.5,
+        shapes=threshold_shapes(polluant, show_thresholds),
         yaxis=dict(
             title=f"{polluant} {UNITS[polluant]}",
             autorange=True,  # Enable autoscale for y-axis
         ),
         xaxis_title="",
-        xaxis2_showticklabels=False,
         showlegend=False,
         plot_bgcolor="#f9f9f9",
         paper_bgcolor="rgba(0,0,0,0)",
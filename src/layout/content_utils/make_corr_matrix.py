@@ -1,12 +1,17 @@
 from plotly import graph_objects as go
 
+from src.utils.stats import column_stats
 
-def make_corr_matrix(graph_data, station_name=None):
+
+def make_corr_matrix(graph_data, station_name=None, stats=None):
+    if stats is None:
+        stats = column_stats(graph_data)
+    corr_matrix = stats["corr"]
     # if station_name rename column station to station_name
-    if station_name and "station" in graph_data.columns:
-        graph_data = graph_data.rename(columns={"station": station_name})
-    # Calculate the correlation matrix
-    corr_matrix = graph_data.corr()
+    if station_name and "station" in corr_matrix.columns:
+        corr_matrix = corr_matrix.rename(
+            index={"station": station_name}, columns={"station": station_name}
+        )
    
     fig_corr = go.Figure(
         data=go.Heatmap(
@@ -1,6 +1,6 @@
-from src.utils.glob_vars import UNITS, SEUILS
+from src.utils.glob_vars import UNITS
 from plotly import graph_objects as go
-from src.utils.fonctions import weekday_profile
+from src.utils.fonctions import line_trace, threshold_shapes, weekday_profiles
 
 
 def make_diurnal_cycle(
@@ -12,12 +12,13 @@ def make_diurnal_cycle(
     week_section="workweek",
     station_name=None,
     show_thresholds=False,
+    profiles=None,
+    render_mode="auto",
 ):
-    # Compute the diurnal cycle profile inside the function
-    diurnal_data = weekday_profile(
-        data=graph_data,
-        week_section=week_section,
-    )
+    # Both week sections come from one pass, pass them in to share it
+    if profiles is None:
+        profiles = weekday_profiles(graph_data)
+    diurnal_data = profiles[week_section]["mean"]
 
     # Handle empty diurnal_data gracefully
     if diurnal_data.empty or len(diurnal_data.index) < 2:
@@ -32,30 +33,20 @@ def make_diurnal_cycle(
 
     dcycle_xticks_div = 2 if aggregation == "quart-horaire" else 1
     fig = go.Figure()
+    Trace = line_trace(diurnal_data.size, render_mode)
     for col in diurnal_data.columns:
         fig.add_trace(
-            go.Scatter(
+            Trace(
                 y=diurnal_data[col],
                 x=diurnal_data.index,
                 line=dict(color=color_map.get(col, None)),
                 name=station_name if col == "station" else col,
             )
         )
-    # Add seuils if requested and polluant is PM10 or PM2.5
-    if show_thresholds and polluant in ["PM10", "PM2.5"]:
-        for i, seuil in enumerate(list(SEUILS[polluant]["FR"].keys())):
-            fig.add_trace(
-                go.Scatter(
-                    y=[SEUILS[polluant]["FR"][seuil]] * len(diurnal_data.index),
-                    x=diurnal_data.index,
-                    name=seuil,
-                    line=dict(color="black", dash="dash"),
-                    showlegend=False,
-                )
-            )
     fig.update_layout(
         title=title,
         title_x=0.5,
+        shapes=threshold_shapes(polluant, show_thresholds),
         xaxis=dict(
             nticks=round(len(diurnal_data.index) / dcycle_xticks_div),
             tick0=diurnal_data.index[1],
@@ -1,51 +1,29 @@
 from plotly import graph_objects as go
-from src.utils.fonctions import get_geoDF
 
 
 def make_map(
-    graph_data,
+    gdf,
     color_map,
-    polluant,
-    start_date,
-    end_date,
     station_name=None,
 ):
-
-    gdf = get_geoDF(
-        id_capteur=[
-            int(col.split("_")[-1]) for col in graph_data.columns if col != "station"
-        ],
-        polluant=polluant,
-        start_date=start_date,
-        end_date=end_date,
-        nom_station=station_name,
-    )
-
     fig_map = go.Figure(layout=dict(height=600, width=800))
-    capteur_cols = [col for col in graph_data.columns if col != "station"]
-    for idx, cap_id in enumerate(capteur_cols):
-        row = gdf.iloc[idx]
-        color = color_map[cap_id]
+    # Sensors first, station last
+    for row in sorted(gdf.itertuples(), key=lambda row: row.column == "station"):
+        if row.column == "station":
+            name = station_name
+            color = "firebrick"
+        else:
+            name = row.column
+            color = color_map.get(row.column, None)
         fig_map.add_trace(
             go.Scattermapbox(
-                lat=[row.geometry.y],
-                lon=[row.geometry.x],
-                name=f"{cap_id}",
+                lat=[row.lat],
+                lon=[row.lon],
+                name=f"{name}",
                 mode="markers",
                 marker=dict(size=15, color=color),
             )
         )
-    if station_name and len(gdf) > len(capteur_cols):
-        station_row = gdf.iloc[-1]
-        fig_map.add_trace(
-            go.Scattermapbox(
-                lat=[station_row.geometry.y],
-                lon=[station_row.geometry.x],
-                name=station_name,
-                mode="markers",
-                marker=dict(size=15, color="firebrick"),
-            )
-        )
     fig_map.update_layout(
         mapbox_style="open-street-map",
         mapbox_zoom=6.5,
@@ -1,7 +1,9 @@
 import pandas as pd
 
+from src.utils.stats import column_stats
 
-def make_summary_table(graph_data, station_name):
+
+def make_summary_table(graph_data, station_name, stats=None):
     NAME = "Nom"
     MEAN = "Concentration moyenne (µg/m³)"
     MINMAX = "Min / Max (µg/m³)"
@@ -13,13 +15,14 @@ def make_summary_table(graph_data, station_name):
         MINMAX: [],
         Q90: [],
     }
-    for col in graph_data.columns:
+    if stats is None:
+        stats = column_stats(graph_data)
+    for col, col_stats in stats["summary"].iterrows():
         name = station_name if station_name and col == "station" else col
-        col_data = graph_data[col]
-        mean_val = col_data.mean()
-        min_val = col_data.min()
-        max_val = col_data.max()
-        q90_val = col_data.quantile(0.9)
+        mean_val = col_stats["mean"]
+        min_val = col_stats["min"]
+        max_val = col_stats["max"]
+        q90_val = col_stats["q90"]
         summary_dict[NAME].append(name)
         summary_dict[MEAN].append(f"{mean_val:.0f}")
         summary_dict[MINMAX].append(f"{min_val:.0f} / {max_val:.0f}")
@@ -1,5 +1,6 @@
-from src.utils.fonctions import graph_title
-from src.utils.glob_vars import SEUILS, UNITS
+from src.utils.fonctions import graph_title, line_trace, threshold_shapes
+from src.utils.glob_vars import UNITS
+from src.utils.downsample import MAX_POINTS, minmax_downsample
 
 from plotly import graph_objects as go
 
@@ -11,6 +12,9 @@ def make_timeseries(
     polluant,
     station_name=None,
     show_thresholds=False,
+    max_points=MAX_POINTS,
+    x_range=None,
+    render_mode="auto",
 ):
     # Handle empty data gracefully
     if graph_data.empty or len(graph_data.index) < 2:
@@ -24,32 +28,27 @@ def make_timeseries(
         return fig
 
     timeseries_fig = go.Figure()
-    for col in graph_data.columns:
+    traces = {
+        col: minmax_downsample(graph_data[col], max_points)
+        for col in graph_data.columns
+    }
+    Trace = line_trace(sum(map(len, traces.values())), render_mode)
+    for col, col_data in traces.items():
         timeseries_fig.add_trace(
-            go.Scatter(
-                y=graph_data[col],
-                x=graph_data.index,
+            Trace(
+                y=col_data.values,
+                x=col_data.index,
                 line=dict(color=color_map[col]),
                 name=station_name if col == "station" else col,
             )
         )
-    # Only show thresholds if requested
-    if show_thresholds and polluant in ["PM10", "PM2.5"]:
-        for i, seuil in enumerate(list(SEUILS[polluant]["FR"].keys())):
-            timeseries_fig.add_trace(
-                go.Scatter(
-                    y=[SEUILS[polluant]["FR"][seuil]] * len(graph_data.index),
-                    x=graph_data.index,
-                    name=seuil,
-                    line=dict(color="black", dash="dash"),
-                    showlegend=False,
-                )
-            )
     # Remove manual dtick for automatic tick handling by Plotly
     timeseries_fig.update_layout(
         title=graph_title("timeseries", aggregation, polluant),
         title_x=0.5,
+        shapes=threshold_shapes(polluant, show_thresholds),
         xaxis=dict(
+            range=x_range,
             showgrid=True,
             gridcolor="#cccccc",
             gridwidth=1.5,
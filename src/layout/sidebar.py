@@ -4,8 +4,9 @@ import dash_bootstrap_components as dbc
 from datetime import datetime, timedelta
 from src.utils.glob_vars import TIME_NOW
 from src.layout.styles import SIDEBAR_STYLE
-from api_calls.microspot_api import request_microspot
-from api_calls.xair import ISO, request_xr, time_window
+from src.utils.fonctions import RENDER_MODES
+from api_calls.microspot_catalog import microspot_catalog
+from api_calls.xair import ISO, time_window, xr_catalog
 from maindash import app
 
 
@@ -21,6 +22,26 @@ def get_sidebar():
                 id="polluant_dropdown",
                 style={"border": "0", "background": "transparent"},
             ),
+            # Tickbox pour charger toutes les fractions PM en une fois
+            dcc.Checklist(
+                options=[
+                    {
+                        "label": html.Span(
+                            "Charger PM10, PM2.5 et PM1 ensemble",
+                            style={"margin-left": "8px"},
+                        ),
+                        "value": "all_fractions",
+                    }
+                ],
+                value=[],
+                id="all_fractions_checkbox",
+                style={
+                    "margin-top": "10px",
+                    "display": "flex",
+                    "alignItems": "center",
+                },
+                inputStyle={"margin-right": "8px"},
+            ),
             # Tickbox si on veut afficher les seuils
             dcc.Checklist(
                 options=[
@@ -51,7 +72,7 @@ def get_sidebar():
                 end_date=time_window(format="%Y-%m-%d")[1],
                 display_format="YYYY-MM-DD",
                 style={"font-size": 6},
-                max_date_allowed=datetime.now().date()+ timedelta(days=1),
+                max_date_allowed=datetime.now().date() + timedelta(days=1),
             ),
             html.P(
                 "Les dates sont en TU.",
@@ -70,6 +91,18 @@ def get_sidebar():
                 "Les données de capteurs au pas de temps horaire sont corrigées, celles au pas de temps quart-horaire sont brutes.",
                 style={"font-size": "0.8em", "color": "#888"},
             ),
+            html.B("Rendu des courbes"),
+            # WebGL is picked automatically for long series
+            dcc.RadioItems(
+                options=[
+                    {"label": label, "value": value}
+                    for value, label in RENDER_MODES.items()
+                ],
+                value="auto",
+                id="render_mode_radio",
+                inline=True,
+                inputStyle={"margin-right": "4px", "margin-left": "8px"},
+            ),
             html.Hr(),
             html.B("Sites"),
             dcc.Dropdown(
@@ -134,8 +167,8 @@ def get_sidebar():
     Input("polluant_dropdown", "value"),
 )
 def get_station_dropdown(poll: str) -> list:
-    list_options = request_xr(
-        folder="measures", physicals=ISO[poll], groups="DIDON"
+    list_options = xr_catalog.measures(
+        physicals=ISO[poll], groups="DIDON"
     ).id_site.unique()
     return list_options
 
@@ -147,16 +180,13 @@ def get_station_dropdown(poll: str) -> list:
     Input("my-date-picker-range", "end_date"),
 )
 def get_capteur_site_dropdown(poll: str, start_date: str, end_date: str):
-    data = request_microspot(
-        observationTypeCodes=[ISO[poll]],
-        dateRange=[f"{start_date}T00:00:00+00:00", f"{end_date}T00:00:00+00:00"],
-        aggregation="horaire",
+    sites = microspot_catalog.sites(
+        poll, f"{start_date}T00:00:00+00:00", f"{end_date}T00:00:00+00:00"
     )
-    data = data[~data.site_name.isnull()]
-    data["site_capteurID"] = data.apply(
-        lambda row: f"{row['site_name']} - {row['capteur_id']}", axis=1
-    )
-    options = [{"label": v, "value": v} for v in data["site_capteurID"].unique()]
+    if sites.empty:
+        return []
+    labels = sites["site_name"] + " - " + sites["capteur_id"].astype(str)
+    options = [{"label": v, "value": v} for v in labels.unique()]
     return options
 
 
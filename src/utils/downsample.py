@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Points per line trace sent to the browser, 0 disables downsampling
+MAX_POINTS = int(os.getenv("MICAEXP_MAX_POINTS_PER_TRACE", 4000))
+
+
+def minmax_downsample(series: pd.Series, max_points: int = MAX_POINTS) -> pd.Series:
+    """
+    Keep at most max_points samples of series: the series is cut into
+    max_points / 2 buckets and the min and max of each bucket are kept, in
+    time order, so peaks stay visible. Buckets without data keep one NaN
+    sample so gaps are still drawn as gaps.
+    """
+    n_points = len(series)
+    if not max_points or n_points <= max_points:
+        return series
+
+    n_buckets = max(max_points // 2, 1)
+    bucket_size = -(-n_points // n_buckets)
+    n_buckets = -(-n_points // bucket_size)
+    values = np.full(n_buckets * bucket_size, np.nan)
+    values[:n_points] = series.to_numpy(dtype=float)
+    buckets = values.reshape(n_buckets, bucket_size)
+
+    empty = np.isnan(buckets).all(axis=1)
+    starts = np.arange(n_buckets) * bucket_size
+    argmin = np.where(np.isnan(buckets), np.inf, buckets).argmin(axis=1)
+    argmax = np.where(np.isnan(buckets), -np.inf, buckets).argmax(axis=1)
+
+    positions = np.concatenate(
+        [
+            starts[~empty] + argmin[~empty],
+            starts[~empty] + argmax[~empty],
+            starts[empty],
+        ]
+    )
+    positions = np.unique(positions[positions < n_points])
+    return series.iloc[positions]
+
+
+# Resolutions of the time series pyramid, finest first, with their
+# resampling frequency (the measured aggregations need none)
+PYRAMID_LEVELS = {
+    "quart-horaire": "15min",
+    "horaire": "h",
+    "journalière": "D",
+    "hebdomadaire": "W",
+}
+
+
+def build_pyramid(graph_data: pd.DataFrame, aggregation: str) -> dict:
+    """
+    Mean rollups of graph_data at its own aggregation and every coarser
+    level of PYRAMID_LEVELS
+
+    return :
+    --------
+        pyramid : dict
+            aggregation label -> DataFrame, finest first
+    """
+    labels = list(PYRAMID_LEVELS)
+    pyramid = {aggregation: graph_data}
+    for label in labels[labels.index(aggregation) + 1 :]:
+        pyramid[label] = graph_data.resample(PYRAMID_LEVELS[label]).mean()
+    return pyramid
+
+
+def pyramid_window(
+    pyramid: dict,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    max_points: int = MAX_POINTS,
+) -> tuple:
+    """
+    Rows of the finest pyramid level with at most max_points samples
+    between start and end, plus one sample on each side so lines reach the
+    edges of the window
+
+    return :
+    --------
+        aggregation : str
+        window : pd.DataFrame
+    """
+    for aggregation, level in pyramid.items():
+        first = max(level.index.searchsorted(start) - 1, 0)
+        last = level.index.searchsorted(end, side="right") + 1
+        if not max_points or last - first <= max_points:
+            break
+    return aggregation, level.iloc[first:last]
@@ -0,0 +1,223 @@
+import io
+import json
+import os
+import re
+import zlib
+from urllib.parse import urlencode
+
+import pandas as pd
+from dotenv import load_dotenv
+from flask import Response, abort, jsonify, request, send_file, stream_with_context
+
+from api_calls.xair import ISO
+from src.utils.glob_vars import UNITS
+from src.utils.query_store import normalize_query, query_key, query_store
+
+load_dotenv()
+
+# Rows rendered to CSV at a time by the export route
+CHUNK_ROWS = int(os.getenv("MICAEXP_EXPORT_CHUNK_ROWS", 20000))
+# Longest date range accepted by the export routes
+MAX_DAYS = int(os.getenv("MICAEXP_EXPORT_MAX_DAYS", 366))
+# Sensors are "<site name> - <device id>", as in the sites dropdown
+SENSOR_PATTERN = re.compile(r".+ - \d+")
+EXPORT_ROUTE = "/export/donnees"
+METADATA_ROUTE = "/export/metadonnees"
+EXPORT_FORMATS = {
+    "csv": "CSV",
+    "parquet": "Parquet",
+    "feather": "Feather (Arrow IPC)",
+}
+# Sensors values: raw at the quarter hour, corrected at the hour
+SENSOR_VALUES = {"quart-horaire": "raw", "horaire": "corrected"}
+
+
+def csv_chunks(data: pd.DataFrame, chunk_rows: int = CHUNK_ROWS, sep: str = ";"):
+    """
+    data as CSV text, chunk_rows rows at a time, the header with the first
+    chunk: only one chunk is held in memory
+    """
+    yield data.iloc[:0].to_csv(index=True, sep=sep)
+    for start in range(0, len(data.index), chunk_rows):
+        yield data.iloc[start : start + chunk_rows].to_csv(
+            index=True, header=False, sep=sep
+        )
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """
+    Gzip stream of the text chunks
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_metadata(query: dict, aggregation: str, gdf: pd.DataFrame) -> dict:
+    """
+    Description of an exported frame: query, unit, time step and, for each
+    column, the station or sensor it comes from with its site
+    """
+    columns = []
+    for row in gdf.itertuples():
+        is_station = row.column == "station"
+        columns.append(
+            {
+                "column": row.column,
+                "source": "station" if is_station else "microcapteur",
+                "id": (
+                    query["station_name"]
+                    if is_station
+                    else int(row.column.removeprefix("microcapteur_"))
+                ),
+                "site_name": row.site_name,
+                "lon": None if pd.isna(row.lon) else float(row.lon),
+                "lat": None if pd.isna(row.lat) else float(row.lat),
+                "values": "reference" if is_station else SENSOR_VALUES[aggregation],
+            }
+        )
+    return {
+        "polluant": query["polluant"],
+        "unit": UNITS[query["polluant"]],
+        "aggregation": aggregation,
+        "start_date": query["start_date"],
+        "end_date": query["end_date"],
+        "timezone": "UTC",
+        "columns": columns,
+    }
+
+
+def arrow_table(graph_data: pd.DataFrame, metadata: dict):
+    """
+    graph_data as an Arrow table, metadata stored as JSON under the
+    "micaexp" key of the schema metadata
+    """
+    # Imported on first export, not at worker start
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(graph_data, preserve_index=True)
+    return table.replace_schema_metadata(
+        {**table.schema.metadata, b"micaexp": json.dumps(metadata).encode()}
+    )
+
+
+def export_url(
+    query: dict,
+    aggregation: str,
+    compression: str = None,
+    export_format: str = "csv",
+    route: str = EXPORT_ROUTE,
+) -> str:
+    """
+    URL of the export (or metadata) route for a dashboard query
+    """
+    params = {"query": json.dumps(query), "aggregation": aggregation}
+    if export_format != "csv":
+        params["format"] = export_format
+    elif compression:
+        params["compression"] = compression
+    return f"{route}?{urlencode(params)}"
+
+
+def valid_query(query: dict) -> bool:
+    """
+    Whether an export query is one the dashboard can build: known
+    pollutant, sensors from the sites dropdown and a date range of at most
+    MAX_DAYS days
+    """
+    try:
+        start = pd.Timestamp(query["start_date"])
+        end = pd.Timestamp(query["end_date"])
+    except (TypeError, ValueError):
+        return False
+    return (
+        isinstance(query["polluant"], str)
+        and query["polluant"] in ISO
+        and all(
+            isinstance(sensor, str) and SENSOR_PATTERN.fullmatch(sensor)
+            for sensor in query["site_plus_capteur"]
+        )
+        and isinstance(query["station_name"], (str, type(None)))
+        and start <= end <= start + pd.Timedelta(days=MAX_DAYS)
+    )
+
+
+def requested_data():
+    """
+    Query, aggregation and frames of the export request, from the query
+    store where the dashboard put them when the query was displayed
+
+    Nothing is fetched in the request: an invalid query is a 400, and one
+    not in the store (never displayed, or expired) a 409.
+    """
+    try:
+        query = normalize_query(**json.loads(request.args["query"]))
+    except (KeyError, TypeError, ValueError):
+        abort(400)
+    aggregation = request.args.get("aggregation", "horaire")
+    if aggregation not in SENSOR_VALUES or not valid_query(query):
+        abort(400)
+    stored = query_store.get(query_key(**query))
+    if stored is None:
+        abort(409)
+    quart_data, hour_data, gdf = stored
+    graph_data = hour_data if aggregation == "horaire" else quart_data
+    return query, aggregation, graph_data, gdf
+
+
+def export_metadata_view():
+    """
+    Flask view of the metadata sidecar of an export
+    """
+    query, aggregation, _, gdf = requested_data()
+    return jsonify(export_metadata(query, aggregation, gdf))
+
+
+def export_data():
+    """
+    Flask view of the frame of a query: streamed CSV, gzipped with
+    ?compression=gzip, or Parquet / Feather with ?format= (zstd
+    compressed, metadata in the schema)
+    """
+    query, aggregation, graph_data, gdf = requested_data()
+    export_format = request.args.get("format", "csv")
+    compression = request.args.get("compression")
+
+    if export_format in ["parquet", "feather"]:
+        table = arrow_table(graph_data, export_metadata(query, aggregation, gdf))
+        buffer = io.BytesIO()
+        if export_format == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, buffer, compression="zstd")
+        else:
+            import pyarrow.feather as feather
+
+            feather.write_feather(table, buffer, compression="zstd")
+        buffer.seek(0)
+        return send_file(
+            buffer,
+            mimetype=(
+                "application/vnd.apache.arrow.file"
+                if export_format == "feather"
+                else "application/vnd.apache.parquet"
+            ),
+            as_attachment=True,
+            download_name=f"donnees.{export_format}",
+        )
+    if export_format != "csv":
+        abort(400)
+
+    chunks = csv_chunks(graph_data)
+    filename, mimetype = "donnees.csv", "text/csv"
+    if compression == "gzip":
+        chunks = gzip_chunks(chunks)
+        filename, mimetype = "donnees.csv.gz", "application/gzip"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
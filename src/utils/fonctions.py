@@ -1,54 +1,87 @@
+import itertools
+import os
+
 import numpy as np
 import pandas as pd
-import geopandas as gp
 import plotly.colors
+from dotenv import load_dotenv
+from plotly import graph_objects as go
 from src.utils.glob_vars import SEUILS
-from api_calls.microspot_api import request_microspot
-from api_calls.xair import ISO, request_xr
 
+load_dotenv()
 
-def weekday_profile(
-    data: pd.DataFrame,
-    week_section: str,
-):
-    # Ensure index has a name, fallback to 'date'
-    index = data.index.name or "date"
-    if data.index.name is None:
-        data.index.name = "date"
-    data.reset_index(inplace=True)
-    if week_section == "workweek":
-        days_data = data[data[index].dt.weekday < 5]
-    if week_section == "weekend":
-        days_data = data[data[index].dt.weekday > 4]
-
-    out_data = pd.DataFrame()
-
-    for col in days_data.columns:
-        grouped_data = (
-            days_data[[index, col]]
-            .groupby(days_data[index].dt.time)
-            .mean()
-            .drop([index], axis=1)
-        )
-        out_data = pd.concat([out_data, grouped_data], axis=1)
-    datime_format = "%H:%M:%S"
+WEEK_SECTIONS = {"workweek": 0, "weekend": 1}
 
-    out_data.index.name = "heure"
-    out_data.reset_index(inplace=True)
-    out_data["heure"] = pd.to_datetime(out_data["heure"], format=datime_format)
-    out_data.set_index("heure", inplace=True)
+# Line points per figure above which traces are drawn with WebGL. In
+# headless Chromium (benchmarks/bench_webgl.py --headless), SVG rendered
+# faster at every size measured, up to 200000 points: 4.8 s against 26.3 s
+# there, 0.48 s against 2.3 s at 10000. That Chromium draws WebGL in
+# software, rerun the HTML page of the benchmark on GPU machines to lower it.
+WEBGL_THRESHOLD = int(os.getenv("MICAEXP_WEBGL_THRESHOLD", 200000))
+RENDER_MODES = {"auto": "Automatique", "svg": "SVG", "webgl": "WebGL"}
 
-    data.set_index(index, inplace=True)
-    return out_data
+
+def weekday_profiles(
+    data: pd.DataFrame,
+    counts: bool = False,
+    quantiles: list[float] = None,
+) -> dict:
+    """
+    Mean diurnal profile of every column, for workweek and weekend days
+
+    All sections and columns come from a single groupby on (weekend flag,
+    minute of day) codes computed from the index; data is neither modified
+    nor copied.
+
+    return :
+    --------
+        profiles : dict
+            profiles[week_section]["mean"] (and "count", f"q{quantile}" when
+            requested) is a DataFrame indexed by "heure", the time of day on
+            1900-01-01
+    """
+    stats = ["mean"] + (["count"] if counts else [])
+    stats += [f"q{quantile}" for quantile in quantiles or []]
+    if data.empty:
+        empty = pd.DataFrame(
+            columns=data.columns, index=pd.DatetimeIndex([], name="heure")
+        )
+        return {section: {stat: empty for stat in stats} for section in WEEK_SECTIONS}
+
+    index = pd.DatetimeIndex(data.index)
+    section_codes = (index.weekday > 4).astype(np.int8)
+    minute_codes = (index.hour * 60 + index.minute).astype(np.int16)
+    grouped = data.groupby([section_codes, minute_codes])
+
+    results = {"mean": grouped.mean()}
+    if counts:
+        results["count"] = grouped.count()
+    for quantile in quantiles or []:
+        results[f"q{quantile}"] = grouped.quantile(quantile)
+
+    profiles = {section: {} for section in WEEK_SECTIONS}
+    for stat, result in results.items():
+        for section, code in WEEK_SECTIONS.items():
+            if code in result.index.get_level_values(0):
+                profile = result.xs(code, level=0)
+            else:
+                profile = result.iloc[:0].droplevel(0)
+            profile.index = pd.Timestamp("1900-01-01") + pd.to_timedelta(
+                profile.index, unit="min"
+            )
+            profile.index.name = "heure"
+            profiles[section][stat] = profile
+    return profiles
 
 
 def get_color_map(columns):
     """
-    Assigns 'firebrick' to 'station' and Plotly default colors to other columns.
+    Assigns 'firebrick' to 'station' and Plotly default colors to other columns,
+    cycling through them past ten sensors.
     """
     default_colors = plotly.colors.qualitative.Plotly
     color_map = {}
-    color_iter = iter(default_colors)
+    color_iter = itertools.cycle(default_colors)
     for col in columns:
         if col == "station":
             color_map[col] = "firebrick"
@@ -57,6 +90,46 @@ def get_color_map(columns):
     return color_map
 
 
+def line_trace(
+    n_points: int,
+    render_mode: str = "auto",
+    threshold: int = WEBGL_THRESHOLD,
+):
+    """
+    Trace class of the lines of a figure drawing n_points points in total:
+    go.Scattergl past threshold, go.Scatter (SVG) below, unless render_mode
+    forces "svg" or "webgl"
+    """
+    if render_mode == "webgl" or (render_mode == "auto" and n_points > threshold):
+        return go.Scattergl
+    return go.Scatter
+
+
+def threshold_shapes(polluant: str, show_thresholds=True) -> list:
+    """
+    Daily thresholds of polluant as dashed horizontal lines across the plot
+
+    They are layout shapes rather than traces so they can be shown or
+    hidden with a Patch of layout.shapes, without rebuilding the figure.
+    """
+    if not show_thresholds or polluant not in ["PM10", "PM2.5"]:
+        return []
+    return [
+        dict(
+            type="line",
+            xref="paper",
+            x0=0,
+            x1=1,
+            yref="y",
+            y0=value,
+            y1=value,
+            line=dict(color="black", dash="dash"),
+            label=dict(text=seuil, textposition="end", font=dict(size=10)),
+        )
+        for seuil, value in SEUILS[polluant]["FR"].items()
+    ]
+
+
 def graph_title(
     graph_type: str,
     aggregation: str,
@@ -69,6 +142,8 @@ def graph_title(
             title = f"Concentrations moyennes horaires en {polluant}"
         if aggregation == "journalière":
             title = f"Concentrations moyennes journalièrs en {polluant}"
+        if aggregation == "hebdomadaire":
+            title = f"Concentrations moyennes hebdomadaires en {polluant}"
     if graph_type == "boxplot":
         if aggregation == "quart-horaire":
             title = f"Distribution des concentrations quart-horaire en {polluant}"
@@ -79,51 +154,17 @@ def graph_title(
     return title
 
 
-def get_geoDF(
-    id_capteur: list,  # can be int, str, or list
-    polluant: str,
-    start_date: str,
-    end_date: str,
-    nom_station: str,
-):
-    # Collect info for all sensors
-    site_names = []
-    lons = []
-    lats = []
-
-    for capteur_id in id_capteur:
-        capteur_data = request_microspot(
-            observationTypeCodes=[ISO[polluant]],
-            devices=[capteur_id],
-            aggregation="horaire",
-            dateRange=[f"{start_date}T00:00:00+00:00", f"{end_date}T00:00:00+00:00"],
-        )
-        site_names.append(capteur_data["site_name"].values[0])
-        lons.append(capteur_data["site_lon"].values[0])
-        lats.append(capteur_data["site_lat"].values[0])
-
-    # Add station info only if provided
-    if nom_station:
-        station_json = request_xr(
-            folder="sites",
-            sites=nom_station,
-        )
-        site_names.append(station_json["labelSite"].values[0])
-        lons.append(station_json["longitude"].values[0])
-        lats.append(station_json["latitude"].values[0])
-
-    df = pd.DataFrame(
-        data={
-            "site_name": site_names,
-            "lon": lons,
-            "lat": lats,
-        }
-    )
-
-    gdf = gp.GeoDataFrame(
-        df,
-        geometry=gp.points_from_xy(df.lon, df.lat),
-        crs="EPSG:3857",
-    )
-
-    return gdf
+def relayout_x_range(relayout_data: dict):
+    """
+    New x axis range of a graph zoom or pan from its relayoutData, None
+    when the event did not change the x range
+    """
+    if not relayout_data:
+        return None
+    if "xaxis.range[0]" in relayout_data:
+        x_range = [relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]]
+    elif "xaxis.range" in relayout_data:
+        x_range = relayout_data["xaxis.range"]
+    else:
+        return None
+    return tuple(pd.Timestamp(bound) for bound in x_range)
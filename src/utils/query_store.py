@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import diskcache
+from dotenv import load_dotenv
+
+from api_calls.xair import ISO
+from src.layout.content_utils.build_graph_data import (
+    build_fractions_data,
+    build_graph_data,
+)
+from src.utils.downsample import build_pyramid
+
+load_dotenv()
+
+MAX_ENTRIES = int(os.getenv("MICAEXP_QUERY_STORE_SIZE", 32))
+TTL = float(os.getenv("MICAEXP_QUERY_STORE_TTL_MIN", 5)) * 60
+# Shared by the web workers and the background jobs, empty keeps it in memory
+STORE_DIR = os.getenv("MICAEXP_QUERY_STORE_DIR", "data/cache/queries")
+
+
+def normalize_query(
+    start_date: str,
+    end_date: str,
+    site_plus_capteur: list,
+    polluant: str,
+    station_name: str = None,
+) -> dict:
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "site_plus_capteur": sorted(set(site_plus_capteur or [])),
+        "polluant": polluant,
+        "station_name": station_name or None,
+    }
+
+
+def query_key(*args, **kwargs) -> str:
+    """
+    Stable key of a dashboard query, whatever the sensors selection order
+    """
+    query = json.dumps(normalize_query(*args, **kwargs), sort_keys=True)
+    return hashlib.sha1(query.encode()).hexdigest()
+
+
+class QueryStore:
+    """
+    LRU store of build_graph_data results, keyed by query_key
+
+    Entries expire after ttl seconds (or their own ttl, see set) so recent
+    data keeps being refreshed from the time series cache. Concurrent callbacks asking for the same
+    query wait for a single fetch. With a directory, entries are also
+    written to a disk cache so the results computed by background jobs,
+    which run in their own process, are read back by the web workers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MAX_ENTRIES,
+        ttl: float = TTL,
+        directory: str = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = diskcache.Cache(directory) if directory else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> Event set once the thread computing key is done
+        self._inflight = {}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[0]:
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._entries.pop(key, None)
+        if self.disk is None:
+            return None
+        value, expire_time = self.disk.get(key, expire_time=True)
+        if value is not None:
+            self._remember(key, value, expire_time)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Whether get(key) would find a value, without loading it from disk
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[0]:
+                return True
+        return self.disk is not None and key in self.disk
+
+    def set(self, key: str, value, ttl: float = None):
+        """
+        Store value for ttl seconds, the store ttl by default
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._remember(key, value, time.time() + ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, expire=ttl)
+
+    def _remember(self, key: str, value, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            done = self._inflight.get(key)
+            computing = done is None
+            if computing:
+                done = self._inflight[key] = threading.Event()
+        if not computing:
+            # No lock is held while the other thread fetches
+            done.wait()
+            value = self.get(key)
+            if value is not None:
+                return value
+            # The other thread failed
+            value = compute()
+            self.set(key, value)
+            return value
+        try:
+            value = compute()
+            self.set(key, value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+        return value
+
+
+query_store = QueryStore(directory=STORE_DIR)
+# Figures and statistics derived from the query data, see content.render_tab
+render_store = QueryStore()
+
+
+def is_cached(
+    start_date: str,
+    end_date: str,
+    site_plus_capteur: list,
+    polluant: str,
+    station_name: str = None,
+    all_fractions: bool = False,
+) -> bool:
+    """
+    Whether get_graph_data would answer the query from the store, without
+    fetching (with all_fractions, every pollutant of ISO must be stored)
+    """
+    query = normalize_query(
+        start_date, end_date, site_plus_capteur, polluant, station_name
+    )
+    polluants = list(ISO) if all_fractions else [polluant]
+    return all(
+        query_key(**{**query, "polluant": other}) in query_store for other in polluants
+    )
+
+
+def get_graph_data(
+    start_date: str,
+    end_date: str,
+    site_plus_capteur: list,
+    polluant: str,
+    station_name: str = None,
+    on_progress=None,
+    all_fractions: bool = False,
+):
+    """
+    build_graph_data result for the query, fetched at most once per query
+    while it stays in the store (on_progress is only called on a fetch)
+
+    With all_fractions, every pollutant of ISO is fetched at once (unless
+    they are all stored already) and each is stored under its own query:
+    switching pollutant afterwards is a store hit.
+    """
+    query = normalize_query(
+        start_date, end_date, site_plus_capteur, polluant, station_name
+    )
+
+    if all_fractions and not is_cached(**query, all_fractions=True):
+        fractions = build_fractions_data(
+            start_date=query["start_date"],
+            end_date=query["end_date"],
+            site_plus_capteur=query["site_plus_capteur"],
+            station_name=query["station_name"],
+            on_progress=on_progress,
+        )
+        for other, data in fractions.items():
+            query_store.set(query_key(**{**query, "polluant": other}), data)
+        return fractions[polluant]
+
+    return query_store.get_or_compute(
+        query_key(**query),
+        lambda: build_graph_data(**query, on_progress=on_progress),
+    )
+
+
+def refresh_graph_data(
+    start_date: str,
+    end_date: str,
+    site_plus_capteur: list,
+    polluant: str,
+    station_name: str = None,
+    ttl: float = None,
+):
+    """
+    build_graph_data result for the query, built again (from the time
+    series cache) and stored for ttl seconds in place of any stored one
+    """
+    query = normalize_query(
+        start_date, end_date, site_plus_capteur, polluant, station_name
+    )
+    data = build_graph_data(**query)
+    query_store.set(query_key(**query), data, ttl=ttl)
+    return data
+
+
+def get_pyramid(
+    start_date: str,
+    end_date: str,
+    site_plus_capteur: list,
+    polluant: str,
+    station_name: str = None,
+    aggregation: str = "quart-horaire",
+):
+    """
+    Resolution pyramid (see build_pyramid) of the query data at aggregation,
+    built once and kept in the store next to the data
+    """
+    query = normalize_query(
+        start_date, end_date, site_plus_capteur, polluant, station_name
+    )
+
+    def compute():
+        quart_data, hour_data, _ = get_graph_data(**query)
+        graph_data = hour_data if aggregation == "horaire" else quart_data
+        return build_pyramid(graph_data, aggregation)
+
+    return query_store.get_or_compute(
+        f"{query_key(**query)}:pyramid:{aggregation}", compute
+    )
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUANTILES = {"q1": 0.25, "median": 0.5, "q3": 0.75, "q90": 0.9}
+
+# Outliers sent to the boxplot per column, the most extreme ones are kept
+MAX_OUTLIERS = int(os.getenv("MICAEXP_MAX_OUTLIERS", 500))
+
+
+def column_stats(
+    graph_data: pd.DataFrame,
+    max_outliers: int = MAX_OUTLIERS,
+) -> dict:
+    """
+    Statistics of every column of graph_data, shared by the summary table,
+    the boxplot and the correlation matrix
+
+    Everything is computed on the float NumPy array: one sort along the time
+    axis gives min/max, quantiles (linear interpolation, as pandas and
+    Plotly), Tukey fences and outliers; the pairwise-complete Pearson
+    correlation is obtained from masked matrix products.
+
+    return :
+    --------
+        stats : dict
+            "summary" : DataFrame indexed by column with count, mean, min,
+                max, q1, median, q3, q90, lowerfence, upperfence
+            "outliers" : dict column -> values outside the fences
+            "corr" : correlation DataFrame, like graph_data.corr()
+    """
+    columns = graph_data.columns
+    values = graph_data.to_numpy(dtype=float)
+    n_rows, n_cols = values.shape
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    has_data = count > 0
+    col_idx = np.arange(n_cols)
+
+    # NaN are sorted last: the valid values of column j are ordered[:count[j], j]
+    # (a NaN row keeps the indexing below valid when there is no row at all)
+    ordered = np.sort(values, axis=0) if n_rows else np.full((1, n_cols), np.nan)
+    last = np.maximum(count - 1, 0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        summary = {
+            "count": count,
+            "mean": np.where(has_data, np.nansum(values, axis=0) / count, np.nan),
+        }
+        summary["min"] = np.where(has_data, ordered[0], np.nan)
+        summary["max"] = np.where(has_data, ordered[last, col_idx], np.nan)
+
+        for name, quantile in QUANTILES.items():
+            position = quantile * last
+            low = np.floor(position).astype(int)
+            high = np.ceil(position).astype(int)
+            fraction = position - low
+            result = ordered[low, col_idx] + fraction * (
+                ordered[high, col_idx] - ordered[low, col_idx]
+            )
+            summary[name] = np.where(has_data, result, np.nan)
+
+        # Whiskers end on the furthest samples within 1.5 IQR of the box
+        iqr = summary["q3"] - summary["q1"]
+        low_limit = summary["q1"] - 1.5 * iqr
+        high_limit = summary["q3"] + 1.5 * iqr
+        first_inside = (ordered >= low_limit).argmax(axis=0)
+        n_below_high = (ordered <= high_limit).sum(axis=0)
+        summary["lowerfence"] = np.where(
+            has_data, ordered[first_inside, col_idx], np.nan
+        )
+        summary["upperfence"] = np.where(
+            has_data, ordered[np.maximum(n_below_high - 1, 0), col_idx], np.nan
+        )
+
+    outliers = {}
+    for j, col in enumerate(columns):
+        low_out = ordered[: first_inside[j] if has_data[j] else 0, j]
+        high_out = ordered[n_below_high[j] : count[j], j]
+        if len(low_out) + len(high_out) > max_outliers:
+            n_low = min(
+                len(low_out), max(max_outliers // 2, max_outliers - len(high_out))
+            )
+            n_high = min(len(high_out), max_outliers - n_low)
+            low_out = low_out[:n_low]
+            high_out = high_out[len(high_out) - n_high :]
+        outliers[col] = np.concatenate([low_out, high_out])
+
+    return {
+        "summary": pd.DataFrame(summary, index=columns),
+        "outliers": outliers,
+        "corr": pairwise_corr(values, valid, columns),
+    }
+
+
+def pairwise_corr(
+    values: np.ndarray,
+    valid: np.ndarray,
+    columns: pd.Index,
+) -> pd.DataFrame:
+    """
+    Pearson correlation of each pair of columns over the rows where both are
+    valid, as DataFrame.corr()
+    """
+    mask = valid.astype(float)
+    # Centering first limits cancellation in the sums of products
+    means = np.nansum(values, axis=0) / np.maximum(valid.sum(axis=0), 1)
+    centered = np.where(valid, values - means, 0.0)
+
+    n = mask.T @ mask
+    sum_x = centered.T @ mask
+    sum_xx = (centered**2).T @ mask
+    sum_xy = centered.T @ centered
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sum_xy - sum_x * sum_x.T
+        var_x = n * sum_xx - sum_x**2
+        corr = cov / np.sqrt(var_x * var_x.T)
+    corr[(n < 2) | (var_x <= 0) | (var_x.T <= 0)] = np.nan
+    return pd.DataFrame(np.clip(corr, -1, 1), index=columns, columns=columns)
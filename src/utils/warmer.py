@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from functools import partial
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, the dev server is a single process
+    fcntl = None
+
+from dotenv import load_dotenv
+
+from api_calls.fan_out import fetch_all
+from api_calls.microspot_catalog import microspot_catalog
+from api_calls.ts_cache import ts_cache
+from api_calls.xair import ISO, time_window, xr_catalog
+from src.layout.content_utils.build_graph_data import (
+    request_microspot_devices,
+    request_station,
+)
+from src.utils.query_store import TTL, refresh_graph_data
+
+load_dotenv()
+
+# Minutes between two warm-ups of the default window, 0 disables them.
+# The recent part of the time series cache expires after
+# MICAEXP_CACHE_RECENT_TTL_MIN, a longer interval lets it go cold.
+INTERVAL = float(os.getenv("MICAEXP_WARM_INTERVAL_MIN", 15)) * 60
+STATION_GROUP = "DIDON"
+# Held by the one process of the server running the warm-ups
+LOCK_FILE = "warmer.lock"
+
+
+def logged(name: str, task):
+    """
+    task wrapped so a failure is printed instead of aborting the other
+    warm-up requests
+    """
+    try:
+        return task()
+    except Exception as error:
+        print(f"Cache warm-up of {name} failed: {error}")
+        return None
+
+
+class CacheWarmer:
+    """
+    Fetch the default dashboard window (time_window) ahead of the users
+
+    This is the only background loop of the server. Each run indexes the
+    window in the Microspot catalog and loads the XR sites and measures
+    (the sources of the sites and station dropdowns), warms the time series
+    cache for every device active in the window and every DIDON station,
+    for all pollutants and both aggregations, and stores the empty query
+    the dashboard opens on. That query is kept until the next run, past the
+    query store ttl.
+
+    Every web worker runs the loop, but only the one holding LOCK_FILE
+    warms: the others take over if it exits.
+    """
+
+    def __init__(self, group: str = STATION_GROUP, interval: float = INTERVAL):
+        self.group = group
+        self.interval = interval
+        self._lock_file = None
+
+    def window(self) -> tuple:
+        return time_window(format="%Y-%m-%d")
+
+    def warm_dropdowns(self, start_date: str, end_date: str) -> dict:
+        """
+        Sites and station dropdown sources of every pollutant
+
+        return :
+        --------
+            sources : dict
+                pollutant -> (active devices, station measures)
+        """
+        xr_catalog.sites()
+        return {
+            polluant: (
+                microspot_catalog.sites(
+                    polluant,
+                    f"{start_date}T00:00:00+00:00",
+                    f"{end_date}T00:00:00+00:00",
+                ),
+                xr_catalog.measures(physicals=ISO[polluant], groups=self.group),
+            )
+            for polluant in ISO
+        }
+
+    def warm(self):
+        start_date, end_date = self.window()
+        sources = self.warm_dropdowns(start_date, end_date)
+
+        cap_ids = sorted(
+            {
+                int(cap_id)
+                for sites, _ in sources.values()
+                if not sites.empty
+                for cap_id in sites["capteur_id"]
+            }
+        )
+        tasks = {
+            f"microspot {aggregation}": partial(
+                request_microspot_devices,
+                cap_ids,
+                list(ISO),
+                aggregation,
+                start_date,
+                end_date,
+            )
+            for aggregation in ["quart-horaire", "horaire"]
+        }
+        for polluant, (_, measures) in sources.items():
+            for station_name in measures["id_site"].unique():
+                for datatype in ["quart-horaire", "horaire"]:
+                    tasks[f"{station_name} {polluant} {datatype}"] = partial(
+                        request_station,
+                        station_name,
+                        polluant,
+                        datatype,
+                        start_date,
+                        end_date,
+                    )
+        fetch_all({name: partial(logged, name, task) for name, task in tasks.items()})
+
+        for polluant in ISO:
+            refresh_graph_data(
+                start_date, end_date, [], polluant, ttl=self.interval + TTL
+            )
+
+    def lead(self) -> bool:
+        """
+        Whether this process runs the warm-ups: the first one to lock
+        LOCK_FILE keeps it until it exits
+        """
+        if self._lock_file is not None or fcntl is None:
+            return True
+        os.makedirs(ts_cache.cache_dir, exist_ok=True)
+        lock_file = open(os.path.join(ts_cache.cache_dir, LOCK_FILE), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def warm_forever(self):
+        while True:
+            started = time.monotonic()
+            if self.lead():
+                logged("the default window", self.warm)
+            time.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    def start_background_warm(self):
+        """
+        Keep the default dashboard window warm from a daemon thread
+        """
+        if not self.interval or not ts_cache.enabled:
+            return None
+        thread = threading.Thread(
+            target=self.warm_forever,
+            name="cache-warmer",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+
+cache_warmer = CacheWarmer()
@@ -0,0 +1,91 @@
+"""
+The vectorized XR masks (mask_aorp, mask_duplicates) against the previous
+row-wise implementation kept in benchmarks/bench_xair_masks.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api_calls.xair import mask_aorp, mask_duplicates
+from benchmarks.bench_xair_masks import (
+    MEASURE_IDS,
+    SITE,
+    legacy_mask_aorp,
+    legacy_mask_duplicates,
+    xr_frame,
+)
+
+
+def masked(data: pd.DataFrame, site_name: str, poll_iso: str):
+    new = mask_duplicates(mask_aorp(data.copy()), site_name, poll_iso)
+    legacy = legacy_mask_duplicates(legacy_mask_aorp(data.copy()), site_name, poll_iso)
+    return new, legacy
+
+
+def frame(ids: list[str], states: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "value": np.arange(len(ids), dtype=float),
+            "unit": "µg/m3",
+            "state": states,
+        },
+        index=pd.date_range("2024-01-01", periods=len(ids), freq="15min", name="date"),
+    )
+
+
+@pytest.mark.parametrize("as_category", [False, True])
+@pytest.mark.parametrize("poll_iso, measure_ids", MEASURE_IDS)
+def test_matches_legacy_on_payloads(poll_iso, measure_ids, as_category):
+    data = xr_frame(measure_ids, n_days=2)
+    if as_category:
+        data[["id", "state"]] = data[["id", "state"]].astype("category")
+
+    new, legacy = masked(data, SITE, poll_iso)
+    pd.testing.assert_frame_equal(new, legacy)
+
+
+@pytest.mark.parametrize(
+    "poll_iso, ids",
+    [
+        # Only lower-case PM1 ids named after the site: matched case
+        # insensitively, then selected case sensitively (nothing kept)
+        ("68", ["pm113001", "pm113001_b"]),
+        # Same pattern on several ids: all kept
+        ("24", ["PC13001", "PC13002", "PC13001_b"]),
+        # No id matching the pattern
+        ("24", ["PM1013001", "PM1013002"]),
+        ("39", ["P2FIDAS", "P2FIDAS_2"]),
+        # Single measure id
+        ("68", ["PM113001"]),
+    ],
+)
+def test_matches_legacy_on_edge_cases(poll_iso, ids):
+    data = frame(ids * 3, ["A", "N", None] * len(ids))
+    new, legacy = masked(data, SITE, poll_iso)
+    pd.testing.assert_frame_equal(new, legacy)
+
+
+def test_states_outside_aorp_are_masked():
+    data = frame(["PC13001"] * 6, ["A", "O", "R", "P", "N", None])
+    new, legacy = masked(data, SITE, "24")
+    pd.testing.assert_frame_equal(new, legacy)
+    assert new["value"].isna().tolist() == [False] * 4 + [True] * 2
+
+
+def test_other_pollutants_are_not_filtered():
+    # The legacy function had no branch for them (UnboundLocalError)
+    data = frame(["NO213001", "NO213001_2"], ["A", "A"])
+    pd.testing.assert_frame_equal(
+        mask_duplicates(mask_aorp(data.copy()), SITE, "03"),
+        data[["id", "value", "unit"]],
+    )
+
+
+def test_empty_frame():
+    # The legacy functions raised on an empty response (.str on no values)
+    data = frame([], [])
+    new = mask_duplicates(mask_aorp(data.copy()), SITE, "24")
+    assert new.empty
+    assert new.columns.tolist() == ["id", "value", "unit"]